@@ -4,9 +4,9 @@ from bs4 import BeautifulSoup
 import pandas as pd
 import time
 import re
-from rapidfuzz import fuzz
 from datetime import datetime
 import re
+from job_filters import FilterSpec, compile_filters
 
 # ----------- UTILITY FUNCTIONS ------------
 
@@ -75,18 +75,13 @@ def get_job_details(link):
         return None, None, "Unknown"
 
 
-def job_passes_filters(title, job_info, user_filters, keyword):
-    if fuzz.partial_ratio(title.lower(), keyword.lower()) < 70:
-        return False
-    if user_filters["contract_type"].lower() not in job_info["contract_type"].lower():
-        return False
-    if user_filters["location"] and user_filters["location"].lower() not in job_info["location"].lower():
-        return False
-    if user_filters["working_pattern"].lower() != "both" and user_filters["working_pattern"].lower() not in job_info["working_pattern"].lower():
-        return False
-    if user_filters["min_salary"] and (not job_info["salary_num"] or job_info["salary_num"] < user_filters["min_salary"]):
-        return False
-    return True
+# Fields available on the search results page; band and sponsorship need the advert itself
+APP_LISTING_FIELDS = ("title", "min_salary", "contract_type", "working_pattern", "location")
+
+SPONSORSHIP_CHOICES = {
+    "Only with sponsorship": "Offered",
+    "Only without sponsorship": "Not Offered"
+}
 
 # ----------- STREAMLIT APP MAIN FUNCTION ------------
 
@@ -110,15 +105,17 @@ def main():
         st.info("Set your filters in the sidebar and click **Search Jobs**.")
         return
 
-    filters = {
-        "location": location_filter,
-        "contract_type": contract_type if contract_type != "Any" else "",
-        "working_pattern": working_pattern,
-        "min_band": min_band,
-        "max_band": max_band,
-        "min_salary": min_salary,
-        "sponsorship_filter": sponsorship_filter
-    }
+    spec = FilterSpec(
+        keywords=[keyword],
+        min_salary=min_salary,
+        min_band=min_band,
+        max_band=max_band,
+        contract_type=contract_type if contract_type != "Any" else "",
+        working_pattern=working_pattern if working_pattern != "Both" else "",
+        location=location_filter,
+        sponsorship=SPONSORSHIP_CHOICES.get(sponsorship_filter)
+    )
+    pipeline = compile_filters(spec, APP_LISTING_FIELDS)
 
     results = []
     with st.spinner("Scraping jobs..."):
@@ -161,25 +158,21 @@ def main():
                     pattern_tag = job.select_one("li[data-test='search-result-workingPattern']")
                     pattern = pattern_tag.get_text(strip=True) if pattern_tag else ""
 
-                    job_info = {
+                    job_fields = {
+                        "title": title,
                         "contract_type": contract,
                         "location": location,
                         "working_pattern": pattern,
-                        "salary_num": salary_num
+                        "min_salary": salary_num
                     }
 
-                    if not job_passes_filters(title, job_info, filters, keyword):
+                    # Numeric and text checks run before the fuzzy title match and the detail request
+                    if not pipeline.passes_listing(job_fields):
                         continue
 
                     band_text, band_num, sponsorship = get_job_details(full_link)
-                    if not band_num:
-                        continue
-                    if band_num < filters["min_band"] or band_num > filters["max_band"]:
-                        continue
-                    # Apply sponsorship filter
-                    if filters["sponsorship_filter"] == "Only with sponsorship" and sponsorship != "Likely Offered":
-                        continue
-                    if filters["sponsorship_filter"] == "Only without sponsorship" and sponsorship != "Not Offered":
+                    job_fields.update({"band": band_num, "sponsorship": sponsorship})
+                    if not pipeline.passes_detail(job_fields):
                         continue
 
 
@@ -6,9 +6,14 @@ import requests
 from bs4 import BeautifulSoup
 from rapidfuzz import fuzz
 from datetime import datetime
+from categories import BAND_DTYPE, band_label, band_mask
+from host_control import limited_get
 import smtplib
 from email.message import EmailMessage
 import ssl
+from nhs_api import iter_search_pages, vacancy_to_row
+from export import ResultExport
+from jobs import deadline_after, expired, partial_notice
 
 def send_email_with_csv(receiver_email, subject, body, csv_data, filename="nhs_jobs.csv"):
     sender_email = "your.email@example.com"   # Replace with your email
@@ -20,7 +25,9 @@ def send_email_with_csv(receiver_email, subject, body, csv_data, filename="nhs_j
     msg['To'] = receiver_email
     msg.set_content(body)
 
-    msg.add_attachment(csv_data.encode(), maintype="text", subtype="csv", filename=filename)
+    if isinstance(csv_data, str):
+        csv_data = csv_data.encode()
+    msg.add_attachment(csv_data, maintype="text", subtype="csv", filename=filename)
 
     # Gmail SMTP
     context = ssl.create_default_context()
@@ -30,53 +37,42 @@ def send_email_with_csv(receiver_email, subject, body, csv_data, filename="nhs_j
 
 
 # --- Helper: Scrape NHS Jobs ---
-def fetch_nhs_jobs(keyword, salary_from, max_pages, location_filter, band_from, band_to, progress_callback=None):
-    base_url = "https://www.jobs.nhs.uk/api/v1/search_xml"
+def fetch_nhs_jobs(keyword, salary_from, max_pages, location_filter, band_from, band_to, progress_callback=None,
+                   deadline=None):
     jobs = []
-    for page in range(1, max_pages + 1):
-        params = {
-            "keyword": keyword,
-            "page": page,
-            "sort": "publicationDateDesc",
-            "contractType": "Permanent",
-            "salaryFrom": salary_from
-        }
-
-        if location_filter:
-            params["location"] = location_filter
-            params["distance"] = 100  # arbitrary radius
-
-        response = requests.get(base_url, params=params)
-        if response.status_code != 200:
-            break
-
-        soup = BeautifulSoup(response.content, "xml")
-        listings = soup.find_all("vacancyDetails")
-
+    skipped_pages = 0
+    params = {
+        "keyword": keyword,
+        "sort": "publicationDateDesc",
+        "contractType": "Permanent",
+        "salaryFrom": salary_from
+    }
+
+    if location_filter:
+        params["location"] = location_filter
+        params["distance"] = 100  # arbitrary radius
+
+    for page, status_code, listings in iter_search_pages(params, max_pages):
         if not listings:
             break
 
         for job in listings:
-            title = job.title.text if job.title else ""
-            if fuzz.token_set_ratio(keyword.lower(), title.lower()) < 80:
+            if fuzz.token_set_ratio(keyword.lower(), job["title"].lower()) < 80:
                 continue
 
-            jobs.append({
-                "Title": title,
-                "Employer": job.employer.text if job.employer else "",
-                "Description": job.description.text if job.description else "",
-                "Location(s)": ", ".join([loc.text for loc in job.find_all("locations")]),
-                "Salary": job.salary.text if job.salary else "",
-                "Closing Date": job.closeDate.text if job.closeDate else "",
-                "Post Date": job.postDate.text if job.postDate else "",
-                "Reference": job.reference.text if job.reference else "",
-                "URL": job.url.text if job.url else ""
-            })
+            jobs.append(vacancy_to_row(job))
 
         if progress_callback:
             progress_callback(page / max_pages)
 
-    return pd.DataFrame(jobs)
+        if expired(deadline):
+            # search_xml reports no total, so only the next page is known to be unread
+            skipped_pages = min(max_pages - page, 1)
+            break
+
+    df = pd.DataFrame(jobs)
+    df.attrs.update(incomplete=bool(skipped_pages), skipped_pages=skipped_pages)
+    return df
 
 # --- Helper: Clean salary ---
 def parse_salary_fields(df):
@@ -120,26 +116,29 @@ def clean_dates(df):
 # --- Helper: Get band from job page ---
 def get_pay_band(url):
     try:
-        response = requests.get(url, timeout=10)
+        response = limited_get(requests, url)
         if response.status_code == 200:
             soup = BeautifulSoup(response.text, "html.parser")
             band = soup.select_one("#payscheme-band")
             return band.get_text(strip=True) if band else "Not found"
-    except:
+    except requests.RequestException:
         pass
     return "Not found"
 
 # --- Helper: Band filter ---
-def apply_band_filter(df, band_from, band_to):
-    st.info("Fetching job details (band + job type)... ⏳")
-    def extract_number(text):
-        match = re.search(r'(\d+)', text)
-        return int(match.group(1)) if match else None
+def apply_band_filter(df, band_from, band_to, deadline=None):
+    """Keep rows in the band range; once `deadline` passes, the remaining rows are skipped unfetched."""
+    if band_from <= 1 and band_to >= 9:
+        return df  # every band passes, so no detail page is worth fetching
 
-    df['Pay Band'] = df['URL'].apply(get_pay_band)
-    df['Band Num'] = df['Pay Band'].apply(extract_number)
-    df = df[df['Band Num'].notnull() & (df['Band Num'] >= band_from) & (df['Band Num'] <= band_to)]
-    return df
+    st.info("Fetching job details (band + job type)... ⏳")
+    bands = [None if expired(deadline) else get_pay_band(url) for url in df['URL']]
+    df['Pay Band'] = pd.Series(bands, index=df.index).map(band_label).astype(BAND_DTYPE)
+    filtered = df[band_mask(df['Pay Band'], band_from, band_to)]
+    skipped = sum(band is None for band in bands)
+    if skipped:
+        filtered.attrs.update(incomplete=True, skipped_details=skipped)
+    return filtered
 
 # --- Streamlit UI ---
 st.set_page_config("NHS Job Search Tool", layout="wide")
@@ -152,6 +151,8 @@ with st.sidebar.form("search_form"):
     band_from = st.number_input("Band From", value=3, min_value=1, max_value=9)
     band_to = st.number_input("Band To", value=8, min_value=1, max_value=9)
     pages = st.number_input("Pages to Search", value=5, min_value=1, max_value=10000)
+    time_budget = st.number_input("Time budget (minutes, 0 = no limit)", value=0, min_value=0,
+                                  help="Stop fetching pages and job details after this long and show what was found.")
     location = st.text_input("Location (optional)", value="")
 
     submit = st.form_submit_button("Search")
@@ -159,6 +160,7 @@ with st.sidebar.form("search_form"):
 if submit:
     progress = st.progress(0)
     status = st.empty()
+    deadline = deadline_after(time_budget * 60)
 
     df = fetch_nhs_jobs(
         keyword=keyword,
@@ -167,15 +169,22 @@ if submit:
         location_filter=location,
         band_from=band_from,
         band_to=band_to,
-        progress_callback=lambda p: progress.progress(p)
+        progress_callback=lambda p: progress.progress(p),
+        deadline=deadline
     )
+    skipped_pages = df.attrs.get("skipped_pages", 0)
 
     if df.empty:
         st.error("No matching jobs found.")
     else:
         df = parse_salary_fields(df)
         df = clean_dates(df)
-        df = apply_band_filter(df, band_from, band_to)
+        df = apply_band_filter(df, band_from, band_to, deadline)
+        partial_notice({
+            "incomplete": bool(skipped_pages or df.attrs.get("skipped_details")),
+            "skipped_pages": skipped_pages,
+            "skipped_details": df.attrs.get("skipped_details", 0),
+        })
 
         if df.empty:
             st.warning("No jobs matched the selected band filters.")
@@ -183,11 +192,12 @@ if submit:
             st.success(f"✅ Found {len(df)} job(s) matching your filters.")
             st.dataframe(df)
 
-            # Prepare CSV
-            csv = df.to_csv(index=False)
+            # Prepare CSV once; the download and the email attachment share the bytes
+            export = ResultExport(df, "nhs_jobs")
+            csv = export.bytes("csv")
 
             # Download Button
-            st.download_button("📥 Download Results as CSV", csv, "nhs_jobs.csv", "text/csv")
+            export.download_button("csv")
 
             # Email Option
             with st.expander("📤 Send Results to Email"):
@@ -0,0 +1,114 @@
+import re
+import pandas as pd
+
+
+# --------- Pay Band ---------
+BAND_LEVELS = [
+    "Band 1", "Band 2", "Band 3", "Band 4", "Band 5", "Band 6", "Band 7",
+    "Band 8a", "Band 8b", "Band 8c", "Band 8d", "Band 9",
+]
+BAND_DTYPE = pd.CategoricalDtype(BAND_LEVELS, ordered=True)
+BAND_RANKS = {label: rank for rank, label in enumerate(BAND_LEVELS)}
+
+_BAND_PATTERNS = (
+    re.compile(r"band[\s_]*(\d)(?!\d)\s*([a-d])?(?![a-z])", re.IGNORECASE),
+    re.compile(r"^\s*(\d)\s*([a-d])?\s*$", re.IGNORECASE),
+)
+
+def band_label(value):
+    """
+    Canonical label ("Band 8a") for band text in any of the forms the sites
+    and the UI use: "Band 8a", "BAND_8A", "8A", 5. A bare 8 reads as 8a.
+    """
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (int, float)):
+        value = str(int(value))
+    match = next((m for m in (p.search(str(value)) for p in _BAND_PATTERNS) if m), None)
+    if not match:
+        return None
+    number, sub_band = match.group(1), (match.group(2) or "").lower()
+    if number == "8":
+        sub_band = sub_band or "a"
+    label = f"Band {number}{sub_band if number == '8' else ''}"
+    return label if label in BAND_RANKS else None
+
+def band_rank(value, upper=False):
+    """
+    Position of a band in BAND_LEVELS, or None. With `upper`, a bare 8
+    means 8d, so a "max band 8" bound keeps every 8 sub-band.
+    """
+    label = band_label(value)
+    if label is None:
+        return None
+    if upper and label == "Band 8a" and not re.search(r"8\s*_?a", str(value), re.IGNORECASE):
+        label = "Band 8d"
+    return BAND_RANKS[label]
+
+def band_mask(bands, min_band=None, max_band=None):
+    """Vectorised range check over a BAND_DTYPE column via its integer codes; unknown bands fail."""
+    codes = bands.astype(BAND_DTYPE).cat.codes
+    low = band_rank(min_band) if min_band is not None else 0
+    high = band_rank(max_band, upper=True) if max_band is not None else len(BAND_LEVELS) - 1
+    return (codes >= low) & (codes <= high)
+
+
+# --------- Contract, Pattern and Employer ---------
+CONTRACT_LEVELS = ["Permanent", "Fixed term", "Secondment", "Bank", "Locum", "Apprenticeship", "Voluntary"]
+CONTRACT_DTYPE = pd.CategoricalDtype(CONTRACT_LEVELS, ordered=True)
+
+PATTERN_LEVELS = [
+    "Full time", "Part time", "Flexible working", "Job share", "Compressed hours",
+    "Term time", "Home or remote working",
+]
+PATTERN_DTYPE = pd.CategoricalDtype(PATTERN_LEVELS, ordered=True)
+
+_CONTRACT_LOOKUP = {level.lower().replace(" ", ""): level for level in CONTRACT_LEVELS}
+_PATTERN_LOOKUP = {level.lower().replace(" ", "").replace("-", ""): level for level in PATTERN_LEVELS}
+
+def _canonical(value, lookup):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    key = str(value).strip().lower().replace(" ", "").replace("-", "")
+    return lookup.get(key)
+
+def contract_label(value):
+    return _canonical(value, _CONTRACT_LOOKUP)
+
+def pattern_label(value):
+    return _canonical(value, _PATTERN_LOOKUP)
+
+
+# --------- Frame Conversion ---------
+# Result column -> (normaliser, dtype); dtype None means categories come from the data
+CATEGORICAL_COLUMNS = {
+    "Band": (band_label, BAND_DTYPE),
+    "Pay Band": (band_label, BAND_DTYPE),
+    "Contract Type": (contract_label, CONTRACT_DTYPE),
+    "Working Pattern": (pattern_label, PATTERN_DTYPE),
+    "Organisation": (None, None),
+    "Employer": (None, None),
+}
+
+def categorize(df):
+    """
+    Convert the band, contract, pattern and employer columns of a results
+    frame to shared categorical dtypes, so filters and sorts compare integer
+    codes and each repeated string is stored once.
+    """
+    df = df.copy()
+    for column, (normalise, dtype) in CATEGORICAL_COLUMNS.items():
+        if column not in df.columns:
+            continue
+        values = df[column].astype(object)
+        if normalise is not None:
+            # Text outside the known levels (e.g. "Full time, Part time") becomes extra
+            # categories ordered after them, so nothing is lost
+            canonical = values.map(normalise)
+            if dtype is not BAND_DTYPE and canonical.isna().any() and values.notna().any():
+                extra = sorted(set(values[canonical.isna() & values.notna()]))
+                dtype = pd.CategoricalDtype(list(dtype.categories) + extra, ordered=True)
+                canonical = canonical.fillna(values)
+            values = canonical
+        df[column] = values.astype(dtype or "category")
+    return df
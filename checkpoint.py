@@ -0,0 +1,164 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import asdict
+
+from records import JobRecord
+
+
+CHECKPOINT_PATH = os.environ.get(
+    "SCRAPE_CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "scrape_checkpoints.sqlite")
+)
+
+# Unfinished runs older than this are dropped rather than resumed
+MAX_CHECKPOINT_AGE = 3 * 24 * 3600
+
+_DATE_FIELDS = ("date_posted", "closing_date")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    run TEXT,
+    scope TEXT,
+    page INTEGER,
+    updated REAL,
+    PRIMARY KEY (run, scope, page)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    run TEXT,
+    scope TEXT,
+    link TEXT,
+    page INTEGER,
+    status TEXT,
+    record TEXT,
+    updated REAL,
+    PRIMARY KEY (run, scope, link)
+);
+"""
+
+
+def run_key(source, *parts):
+    """Stable id for a search: the same source, filters and spec give the same key on every restart."""
+    text = json.dumps([source, *parts], sort_keys=True, default=repr)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def _encode(job):
+    record = asdict(job)
+    for name in _DATE_FIELDS:
+        if record[name] is not None:
+            record[name] = record[name].isoformat()
+    return json.dumps(record)
+
+def _decode(text):
+    record = json.loads(text)
+    for name in _DATE_FIELDS:
+        if record[name] is not None:
+            record[name] = datetime.date.fromisoformat(record[name][:10])
+    return JobRecord(**record)
+
+
+_connections = {}
+_connections_lock = threading.Lock()
+
+def _connect(path):
+    with _connections_lock:
+        if path not in _connections:
+            conn = sqlite3.connect(path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            with conn:
+                cutoff = time.time() - MAX_CHECKPOINT_AGE
+                conn.execute("DELETE FROM pages WHERE updated < ?", (cutoff,))
+                conn.execute("DELETE FROM jobs WHERE updated < ?", (cutoff,))
+            _connections[path] = (conn, threading.Lock())
+        return _connections[path]
+
+
+# --------- Checkpoint Log ---------
+class Checkpoint:
+    """
+    Progress of one search run, kept in SQLite so a rerun, restart or dropped
+    connection resumes instead of starting over.
+
+    Completed listing pages are logged together with the listings they held
+    ("listed"); each detail fetch then logs the enriched record as "kept" or
+    "dropped". `scope` separates the queries of a multi-query run.
+    """
+
+    def __init__(self, run, scope="", path=CHECKPOINT_PATH):
+        self.run, self.scope, self.path = run, scope, path
+        self._conn, self._lock = _connect(path)
+
+    def scoped(self, scope):
+        return Checkpoint(self.run, scope, self.path)
+
+    def _select(self, query, *args):
+        with self._lock:
+            return self._conn.execute(query, (self.run, self.scope, *args)).fetchall()
+
+    # --------- Pages ---------
+    def completed_pages(self):
+        return {row[0] for row in self._select("SELECT page FROM pages WHERE run = ? AND scope = ?")}
+
+    def next_page(self):
+        """First page not yet logged; pages are scraped in order, so everything before it is done."""
+        pages = self.completed_pages()
+        page = 1
+        while page in pages:
+            page += 1
+        return page
+
+    def complete_page(self, page, jobs=()):
+        """Log `page` as done along with its listings, in one transaction."""
+        now = time.time()
+        rows = [
+            (self.run, self.scope, job.link or f"page{page}:{position}", page, "listed", _encode(job), now)
+            for position, job in enumerate(jobs)
+        ]
+        with self._lock, self._conn:
+            # Listings already enriched by an earlier attempt keep their outcome
+            self._conn.executemany("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)", (self.run, self.scope, page, now)
+            )
+
+    # --------- Jobs ---------
+    def finish_job(self, job, kept):
+        """Log a job whose detail page has been processed, with its enriched fields."""
+        if not job.link:
+            return
+        status = "kept" if kept else "dropped"
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, NULL, ?, ?, ?) "
+                "ON CONFLICT(run, scope, link) DO UPDATE SET status = excluded.status, "
+                "record = excluded.record, updated = excluded.updated",
+                (self.run, self.scope, job.link, status, _encode(job), time.time())
+            )
+
+    def listed(self):
+        """Listings from completed pages still waiting on their detail page, in page order."""
+        rows = self._select(
+            "SELECT record FROM jobs WHERE run = ? AND scope = ? AND status = 'listed' ORDER BY page, rowid"
+        )
+        return [_decode(row[0]) for row in rows]
+
+    def kept(self):
+        rows = self._select("SELECT record FROM jobs WHERE run = ? AND scope = ? AND status = 'kept' ORDER BY rowid")
+        return [_decode(row[0]) for row in rows]
+
+    def finished(self):
+        """Links whose detail page was already processed, kept or not."""
+        rows = self._select("SELECT link FROM jobs WHERE run = ? AND scope = ? AND status != 'listed'")
+        return {row[0] for row in rows}
+
+    def clear(self):
+        """Forget the whole run, every scope; called once its results are complete."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM pages WHERE run = ?", (self.run,))
+            self._conn.execute("DELETE FROM jobs WHERE run = ?", (self.run,))
@@ -6,54 +6,34 @@ import pandas as pd
 import numpy as np
 import re
 from datetime import datetime
+from nhs_api import iter_search_pages, vacancy_to_row
+from categories import BAND_DTYPE, band_label, band_mask
+from host_control import limited_get
 
 # === Fetch Jobs from NHS API ===
 def fetch_nhs_jobs(keyword="visa sponsorship", max_pages=30, update_progress=None):
-    base_url = "https://www.jobs.nhs.uk/api/v1/search_xml"
     job_records = []
-    page = 1
-
-    while page <= max_pages:
-        params = {
-            "keyword": keyword,
-            "page": page,
-            "sort": "publicationDateDesc",
-            "contractType": "Permanent",
-            "salaryFrom": 24000,
-        }
-
-        response = requests.get(base_url, params=params)
-        if response.status_code != 200:
-            break
-
-        soup = BeautifulSoup(response.content, "xml")
-        vacancy_list = soup.find_all("vacancyDetails")
+    params = {
+        "keyword": keyword,
+        "sort": "publicationDateDesc",
+        "contractType": "Permanent",
+        "salaryFrom": 24000,
+    }
+
+    for page, status_code, vacancy_list in iter_search_pages(params, max_pages):
         if not vacancy_list:
             break
 
         for job in vacancy_list:
-            title_text = job.title.text if job.title else ""
-            similarity = fuzz.token_set_ratio(keyword.lower(), title_text.lower())
+            similarity = fuzz.token_set_ratio(keyword.lower(), job["title"].lower())
             if similarity < 80:
                 continue
 
-            job_records.append({
-                "Title": title_text,
-                "Employer": job.employer.text if job.employer else "",
-                "Description": job.description.text if job.description else "",
-                "Location(s)": ", ".join([loc.text for loc in job.find_all("locations")]),
-                "Salary": job.salary.text if job.salary else "",
-                "Closing Date": job.closeDate.text if job.closeDate else "",
-                "Post Date": job.postDate.text if job.postDate else "",
-                "Reference": job.reference.text if job.reference else "",
-                "URL": job.url.text if job.url else ""
-            })
+            job_records.append(vacancy_to_row(job))
 
         if update_progress:
             update_progress(page / max_pages)
 
-        page += 1
-
     return pd.DataFrame(job_records)
 
 
@@ -85,13 +65,13 @@ def process_dates(df):
 
 def get_pay_band(url):
     try:
-        response = requests.get(url, timeout=10)
+        response = limited_get(requests, url)
         if response.status_code == 200:
             soup = BeautifulSoup(response.text, "html.parser")
             pay_band_element = soup.select_one("#payscheme-band")
             if pay_band_element:
                 return pay_band_element.get_text(strip=True)
-    except:
+    except requests.RequestException:
         pass
     return "Not found"
 
@@ -102,13 +82,9 @@ def enrich_with_pay_band(df):
 
 
 def filter_by_band(df, min_band=3):
-    def extract_band_number(band_text):
-        match = re.search(r'(\d+)', band_text)
-        return int(match.group(1)) if match else None
-
-    df['Band Number'] = df['Pay Band'].apply(extract_band_number)
-    df = df[df['Band Number'].notnull() & (df['Band Number'] >= min_band)]
-    return df
+    # Ordered band categories: one integer comparison per row, 8a-8d kept distinct
+    df['Pay Band'] = df['Pay Band'].map(band_label).astype(BAND_DTYPE)
+    return df[band_mask(df['Pay Band'], min_band=min_band)]
 
 # === Streamlit App ===
 st.set_page_config("NHS Job Finder", layout="wide")
@@ -134,8 +110,9 @@ if run_search:
 
         df = extract_salary_fields(df)
         df = process_dates(df)
-        df = enrich_with_pay_band(df)
-        df = filter_by_band(df, min_band=band_min)
+        if band_min > 1:  # Band 1 and up matches everything, so skip the detail fetches
+            df = enrich_with_pay_band(df)
+            df = filter_by_band(df, min_band=band_min)
 
         if df.empty:
             st.warning("No jobs matched the minimum band filter.")
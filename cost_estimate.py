@@ -0,0 +1,118 @@
+import math
+import random
+import time
+from dataclasses import dataclass, field
+
+import pandas as pd
+import streamlit as st
+
+from host_control import host_breaker, host_limit
+
+
+# Random pages sampled per query on top of page 1
+EXTRA_SAMPLE_PAGES = 2
+
+
+@dataclass
+class QueryEstimate:
+    query: str
+    pages: int                  # search pages the run would request
+    listings: float             # adverts those pages hold
+    detail_fetches: float       # adverts left after the cheap checks that still need their detail page
+    page_seconds: float         # observed time per search page
+    total_reported: bool = True  # False when the site gave no total and `pages` is the requested maximum
+
+
+@dataclass
+class CostEstimate:
+    """Projected size of a search, built from a few sampled pages per query before committing to it."""
+    source: str
+    queries: list = field(default_factory=list)
+    detail_seconds: float = 1.0  # per detail fetch
+    concurrency: int = 1         # detail fetches in flight at once
+    page_delay: float = 0.0      # fixed pause the scraper takes after each page
+
+    @property
+    def pages(self):
+        return sum(q.pages for q in self.queries)
+
+    @property
+    def listings(self):
+        return round(sum(q.listings for q in self.queries))
+
+    @property
+    def detail_fetches(self):
+        return round(sum(q.detail_fetches for q in self.queries))
+
+    @property
+    def requests(self):
+        return self.pages + self.detail_fetches
+
+    def mean_page_seconds(self, default=1.0):
+        seen = [q.page_seconds for q in self.queries if q.page_seconds]
+        return sum(seen) / len(seen) if seen else default
+
+    @property
+    def seconds(self):
+        page_time = sum(q.pages * (q.page_seconds + self.page_delay) for q in self.queries)
+        return page_time + self.detail_fetches * self.detail_seconds / max(self.concurrency, 1)
+
+    def summary(self):
+        minutes = self.seconds / 60
+        duration = f"{minutes:.0f} min" if minutes >= 1 else f"{self.seconds:.0f} s"
+        bound = "" if all(q.total_reported for q in self.queries) else " (at most)"
+        return (f"About {self.listings:,} adverts{bound} over {self.pages:,} search page(s); "
+                f"{self.detail_fetches:,} detail fetches after the cheap filters; "
+                f"{self.requests:,} requests in total, roughly {duration}.")
+
+    def to_frame(self):
+        return pd.DataFrame({
+            "Query": [q.query for q in self.queries],
+            "Pages": [q.pages for q in self.queries],
+            "Adverts": [round(q.listings) for q in self.queries],
+            "Detail Fetches": [round(q.detail_fetches) for q in self.queries],
+            "Seconds per Page": [round(q.page_seconds, 2) for q in self.queries],
+        })
+
+
+# --------- Sampling Helpers ---------
+def sample_pages(pages, extra=EXTRA_SAMPLE_PAGES, rng=random):
+    """Page 1 plus up to `extra` distinct random pages from the rest of the run."""
+    return [1] + sorted(rng.sample(range(2, pages + 1), min(extra, max(pages - 1, 0))))
+
+def timed(fetch, *args, **kwargs):
+    """(result, seconds) for one sampled request."""
+    start = time.monotonic()
+    result = fetch(*args, **kwargs)
+    return result, time.monotonic() - start
+
+def rates(samples):
+    """
+    Listings per page, share needing a detail fetch and seconds per page from
+    `samples`: (listings, detail_fetches, seconds) for each sampled page.
+    """
+    if not samples:
+        return 0.0, 0.0, 0.0
+    listed = sum(s[0] for s in samples)
+    per_page = listed / len(samples)
+    detail_share = sum(s[1] for s in samples) / listed if listed else 0.0
+    seconds = sum(s[2] for s in samples) / len(samples)
+    return per_page, detail_share, seconds
+
+def pages_for(listings, per_page, max_pages):
+    if not per_page:
+        return 1
+    return max(1, min(max_pages, math.ceil(listings / per_page)))
+
+def detail_speed(url, fallback):
+    """(seconds per detail fetch, concurrency) for `url`'s host from what this process has seen so far."""
+    seconds = host_breaker(url).latency()
+    return (seconds if seconds is not None else fallback), max(int(host_limit(url).limit), 1)
+
+
+# --------- Streamlit Panel ---------
+def show_estimate(estimate, time_budget_minutes=0):
+    st.info(f"📏 {estimate.summary()}")
+    st.dataframe(estimate.to_frame())
+    if time_budget_minutes and estimate.seconds > time_budget_minutes * 60:
+        st.warning("⏱️ This is longer than the time budget, so the search would stop early with partial results.")
@@ -0,0 +1,130 @@
+import re
+import zlib
+import numpy as np
+
+
+CLUSTER_COLUMN = "Cluster ID"
+
+# Columns read for each part of an advert's text, first one present wins
+# (NHS frames say Organisation, Trac frames say Employer)
+TEXT_COLUMNS = (("Title",), ("Organisation", "Employer"), ("Description",))
+
+NUM_PERM = 128
+SHINGLE_SIZE = 5
+_HASH_SEED = 1_337
+
+
+# --------- Shingling ---------
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def shingles(text, size=SHINGLE_SIZE):
+    """
+    Character `size`-grams of the normalised text as stable 32-bit hashes.
+    Characters rather than words, so "Band 5 Staff Nurse" and "Staff Nurse
+    (Band 5)" still share most of their shingles.
+    """
+    text = " ".join(_tokens(text))
+    grams = [text[i:i + size] for i in range(max(len(text) - size + 1, 1))] if text else []
+    return np.array(sorted({zlib.crc32(g.encode()) for g in grams}), dtype=np.uint64)
+
+
+# --------- MinHash ---------
+class MinHasher:
+    """
+    `num_perm` multiply-shift hash functions over 32-bit shingle hashes.
+
+    The fraction of equal signature slots between two adverts estimates the
+    Jaccard similarity of their shingle sets.
+    """
+
+    def __init__(self, num_perm=NUM_PERM, seed=_HASH_SEED):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self._a = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes):
+        if not len(shingle_hashes):
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        # uint64 arithmetic wraps, which is exactly the multiply-shift family
+        hashed = (self._a[:, None] * shingle_hashes[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1).astype(np.uint32)
+
+    def signatures(self, texts):
+        if not len(texts):
+            return np.empty((0, self.num_perm), dtype=np.uint32)
+        return np.vstack([self.signature(shingles(text)) for text in texts])
+
+
+def lsh_bands(num_perm, threshold):
+    """Pick bands x rows = num_perm whose S-curve midpoint (1/b)^(1/r) sits closest to `threshold`."""
+    options = [(b, num_perm // b) for b in range(1, num_perm + 1) if num_perm % b == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - threshold))
+
+
+# --------- Clustering ---------
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+def cluster_signatures(signatures, threshold=0.8):
+    """
+    Group rows whose estimated Jaccard similarity reaches `threshold`.
+
+    Only rows that share an LSH bucket are ever compared, so the work grows
+    with the number of near-duplicates rather than with n².
+    """
+    n, num_perm = signatures.shape
+    parent = list(range(n))
+    # Bucket a little below `threshold` so borderline pairs still meet; the
+    # signature comparison below is what enforces it
+    bands, rows = lsh_bands(num_perm, threshold - 0.1)
+
+    for band in range(bands):
+        buckets = {}
+        band_view = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        for i in range(n):
+            buckets.setdefault(band_view[i].tobytes(), []).append(i)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            first = members[0]
+            for other in members[1:]:
+                root_a, root_b = _find(parent, first), _find(parent, other)
+                if root_a == root_b:
+                    continue
+                if np.mean(signatures[first] == signatures[other]) >= threshold:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    return [_find(parent, i) for i in range(n)]
+
+def advert_texts(df):
+    parts = []
+    for candidates in TEXT_COLUMNS:
+        column = next((c for c in candidates if c in df.columns), None)
+        if column is not None:
+            parts.append(df[column].astype(object).fillna("").astype(str))
+    if not parts:
+        return [""] * len(df)
+    text = parts[0]
+    for part in parts[1:]:
+        text = text + " " + part
+    return text.tolist()
+
+def assign_clusters(df, threshold=0.8, num_perm=NUM_PERM):
+    """
+    Return `df` with a `Cluster ID` column: adverts for the same role (re-posted
+    by several trusts, or listed on both sites with small wording changes)
+    share an ID. IDs count up from 1 in row order.
+    """
+    df = df.drop(columns=CLUSTER_COLUMN, errors="ignore")
+    if df.empty:
+        return df.assign(**{CLUSTER_COLUMN: []})
+
+    roots = cluster_signatures(MinHasher(num_perm).signatures(advert_texts(df)), threshold)
+    ids = {}
+    cluster_ids = [ids.setdefault(root, len(ids) + 1) for root in roots]
+    return df.assign(**{CLUSTER_COLUMN: cluster_ids})
@@ -0,0 +1,192 @@
+import datetime
+import os
+import re
+import tempfile
+import pandas as pd
+
+from dedupe import CLUSTER_COLUMN
+
+
+SNAPSHOT_DIR = os.environ.get("UPLOAD_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "upload_snapshots"))
+
+CHANGE_COLUMN = "Change"
+CHANGE_LOG_SHEET = "Change Log"
+
+# Identity of an advert, first non-empty column wins
+KEY_COLUMNS = ("Reference Number", "Link", "URL")
+
+# Columns that vary between runs without the advert itself changing
+VOLATILE_COLUMNS = (CLUSTER_COLUMN, "Matched Keywords", CHANGE_COLUMN)
+
+
+# --------- Keys and Hashes ---------
+def job_keys(df):
+    """One key per row, plus the column it came from, so a closed row can be written back under it."""
+    keys = pd.Series([None] * len(df), index=df.index, dtype=object)
+    sources = pd.Series([None] * len(df), index=df.index, dtype=object)
+    for column in KEY_COLUMNS:
+        if column in df.columns:
+            values = df[column].astype(object).where(df[column].notna(), None)
+            fill = keys.isna() & values.notna()
+            keys[fill] = values[fill].astype(str)
+            sources[fill] = column
+    if keys.isna().any():
+        fallback = df.get("Title", pd.Series("", index=df.index)).astype(str) + "|" + \
+            df.get("Organisation", df.get("Employer", pd.Series("", index=df.index))).astype(str)
+        missing = keys.isna()
+        keys[missing] = fallback[missing]
+        sources[missing] = "Title"
+    return keys, sources
+
+def content_hashes(df):
+    columns = [c for c in df.columns if c not in VOLATILE_COLUMNS]
+    # Hash the text form so date/Arrow dtype differences between runs don't count as changes
+    return pd.util.hash_pandas_object(df[columns].astype("string"), index=False).astype("uint64")
+
+
+# --------- Snapshots ---------
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, re.sub(r"[^\w-]+", "_", name) + ".parquet")
+
+def load_snapshot(name):
+    path = snapshot_path(name)
+    if not os.path.exists(path):
+        return pd.DataFrame({
+            "key": pd.Series(dtype=object), "key_column": pd.Series(dtype=object),
+            "hash": pd.Series(dtype="uint64"), "title": pd.Series(dtype=object),
+            "closing_date": pd.Series(dtype="datetime64[ns]"), "closed": pd.Series(dtype=bool),
+        })
+    return pd.read_parquet(path)
+
+def save_snapshot(name, snapshot):
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp_path = snapshot_path(name) + ".tmp"
+    snapshot.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, snapshot_path(name))
+
+
+# --------- Change Detection ---------
+def _closing_dates(df):
+    if "Closing Date" not in df.columns:
+        return pd.Series([pd.NaT] * len(df), index=df.index)
+    return pd.to_datetime(df["Closing Date"], errors="coerce")
+
+def compute_delta(df, snapshot, today=None):
+    """
+    Compare a run against the last uploaded snapshot.
+
+    Returns `(delta, change_log, new_snapshot)`: `delta` holds the new and
+    changed rows plus a row for every advert whose Closing Date has passed
+    since it was last uploaded, each tagged in a `Change` column;
+    `change_log` has one short line per change; `new_snapshot` is what to
+    save once the upload succeeds.
+    """
+    today = pd.Timestamp(today or datetime.date.today())
+    keys, key_columns = job_keys(df)
+    current = pd.DataFrame({
+        "key": keys.values,
+        "key_column": key_columns.values,
+        "hash": content_hashes(df).values,
+        "title": df.get("Title", pd.Series("", index=df.index)).astype(str).values,
+        "closing_date": _closing_dates(df).values,
+    })
+    current = current.assign(row=range(len(current))).drop_duplicates(subset=["key"])
+    previous_hash = dict(zip(snapshot["key"], snapshot["hash"]))
+    previously_closed = set(snapshot.loc[snapshot["closed"].astype(bool), "key"])
+
+    is_closed = (current["closing_date"].notna() & (current["closing_date"] < today)).values
+    was_closed = current["key"].isin(previously_closed).values
+    changes = []
+    for key, content_hash, closed, already in zip(current["key"], current["hash"], is_closed, was_closed):
+        if key not in previous_hash:
+            changes.append("new")
+        elif previous_hash[key] != content_hash:
+            changes.append("changed")
+        elif closed and not already:
+            changes.append("closed")
+        else:
+            changes.append(None)
+    changes = pd.Series(changes, index=current.index, dtype=object)
+
+    picked = current[changes.notna()]
+    delta = df.iloc[picked["row"].values].assign(**{CHANGE_COLUMN: changes[changes.notna()].values})
+
+    # Adverts from earlier uploads that have closed since and weren't in this run
+    stale = snapshot[
+        ~snapshot["key"].isin(current["key"]) & ~snapshot["closed"].astype(bool)
+        & (pd.to_datetime(snapshot["closing_date"]) < today)
+    ]
+    if len(stale):
+        closed_rows = pd.DataFrame([
+            {row.key_column: row.key, "Title": row.title, CHANGE_COLUMN: "closed"} for row in stale.itertuples()
+        ])
+        delta = pd.concat([delta, closed_rows], ignore_index=True)
+
+    logged_at = datetime.datetime.now().replace(microsecond=0)
+    change_log = pd.DataFrame({
+        "Logged": logged_at,
+        "Change": list(changes[changes.notna()].values) + ["closed"] * len(stale),
+        "Key": list(picked["key"]) + list(stale["key"]),
+        "Title": list(picked["title"]) + list(stale["title"]),
+    })
+
+    current["closed"] = is_closed | was_closed
+    carried = snapshot[~snapshot["key"].isin(current["key"])].copy()
+    carried["closed"] = carried["closed"].astype(bool) | carried["key"].isin(stale["key"])
+    new_snapshot = pd.concat(
+        [carried, current.drop(columns="row")], ignore_index=True
+    )[["key", "key_column", "hash", "title", "closing_date", "closed"]]
+    new_snapshot["hash"] = new_snapshot["hash"].astype("uint64")
+
+    return delta.reset_index(drop=True), change_log, new_snapshot
+
+
+# --------- Applying a Delta ---------
+def apply_delta(existing_df, delta):
+    """
+    Merge delta rows into an uploaded sheet: new and changed rows replace any
+    row with the same key, closed adverts are marked in place.
+    """
+    if existing_df.empty:
+        return delta
+    if CHANGE_COLUMN not in delta.columns:
+        return pd.concat([existing_df, delta]).drop_duplicates()
+
+    existing_df = existing_df.reset_index(drop=True)
+    existing_keys, _ = job_keys(existing_df)
+    delta_keys, _ = job_keys(delta)
+    closing = (delta[CHANGE_COLUMN] == "closed").values
+    upserts = delta[~closing]
+    closed_keys = set(delta_keys[closing])
+
+    kept = existing_df[~existing_keys.isin(set(delta_keys[~closing])).values].copy()
+    kept_keys = existing_keys[kept.index]
+    if CHANGE_COLUMN not in kept.columns:
+        kept[CHANGE_COLUMN] = None
+    kept.loc[kept_keys.isin(closed_keys).values, CHANGE_COLUMN] = "closed"
+
+    unseen_closed = delta[closing & ~delta_keys.isin(set(kept_keys)).values]
+    return pd.concat([kept, upserts, unseen_closed], ignore_index=True)
+
+
+def coalesce_updates(pending):
+    """
+    Fold several queued {sheet: frame} updates into one, in queue order: a
+    later delta row replaces an earlier one with the same key.
+    """
+    combined = {}
+    for updates in pending:
+        for sheet, df in updates.items():
+            combined.setdefault(sheet, []).append(df)
+
+    result = {}
+    for sheet, frames in combined.items():
+        df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+        if len(frames) > 1 and sheet == CHANGE_LOG_SHEET:
+            # Log lines are keyed by their Key column, not an advert identity; keep every distinct one
+            df = df.drop_duplicates().reset_index(drop=True)
+        elif len(frames) > 1 and CHANGE_COLUMN in df.columns:
+            keys, _ = job_keys(df)
+            df = df[~keys.duplicated(keep="last").values].reset_index(drop=True)
+        result[sheet] = df
+    return result
@@ -0,0 +1,54 @@
+from bs4 import BeautifulSoup
+
+from categories import band_label
+
+
+# --------- Requirement Phrases ---------
+SPONSORSHIP_DENIAL_PHRASES = (
+    "not offer sponsorship", "no sponsorship", "unable to sponsor",
+    "not able to sponsor", "must have right to work",
+    "cannot provide visa", "cannot sponsor", "uk residency required"
+)
+
+LICENSE_PHRASES = (
+    "full uk driving licence", "uk driving license", "driver's license required",
+    "clean driving license", "must have driving licence", "access to a vehicle",
+    "own transport essential", "car driver essential", "you will need to drive"
+)
+
+
+# --------- Text Helpers ---------
+def detect_sponsorship_text(text):
+    if any(phrase in text for phrase in SPONSORSHIP_DENIAL_PHRASES):
+        return "Not Offered"
+    return "Likely Offered"
+
+def detect_license_text(text):
+    return any(phrase in text for phrase in LICENSE_PHRASES)
+
+
+# --------- Detail Page Parsing ---------
+def parse_nhs_job_detail(html):
+    """
+    Parse a raw NHS Jobs advert page and return
+    (band, sponsorship, license_required, ref_number), with `band` as a
+    canonical label such as "Band 8a".
+
+    This runs inside a process pool, so it takes the raw response bytes and
+    returns plain values only — the soup never leaves the worker.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+
+    band_tag = soup.select_one("#payscheme-band")
+    band_text = band_tag.get_text(strip=True) if band_tag else ""
+    band = band_label(band_text)
+
+    ref_tag = soup.select_one("#trac-job-reference")
+    ref_number = ref_tag.get_text(strip=True) if ref_tag else None
+
+    # One full-page text pass shared by both requirement checks
+    page_text = soup.get_text(separator=" ", strip=True).lower()
+    sponsorship = detect_sponsorship_text(page_text)
+    license_required = detect_license_text(page_text)
+
+    return band, sponsorship, license_required, ref_number
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+
+
+# --------- Lazy Detail Enrichment ---------
+class LazyDetails:
+    """
+    Resolve detail-page fields for listing rows only when a row is actually
+    viewed, exported or uploaded.
+
+    `fetch_detail(url)` must return a dict of detail columns. Each URL is
+    fetched at most once; results are cached for the lifetime of the object,
+    which is meant to live in `st.session_state` alongside the results.
+    """
+
+    def __init__(self, fetch_detail, key="Link", max_workers=4):
+        self._fetch_detail = fetch_detail
+        self._key = key
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, url):
+        with self._lock:
+            future = self._futures.get(url)
+            if future is None:
+                future = self._executor.submit(self._fetch_detail, url)
+                self._futures[url] = future
+            return future
+
+    def prefetch(self, urls):
+        """Start fetching `urls` in the background without waiting for them."""
+        for url in urls:
+            if url:
+                self._submit(url)
+
+    def get(self, url):
+        if not url:
+            return {}
+        try:
+            return self._submit(url).result()
+        except Exception:
+            return {}
+
+    def resolve(self, df):
+        """Return a copy of `df` with detail columns filled in for every row; existing values win."""
+        if df.empty:
+            return df.copy()
+
+        urls = list(df[self._key])
+        self.prefetch(urls)
+        details = pd.DataFrame([self.get(url) for url in urls], index=df.index)
+
+        resolved = df.copy()
+        for column in details.columns:
+            if column in resolved.columns:
+                resolved[column] = resolved[column].where(resolved[column].notna(), details[column])
+            else:
+                resolved[column] = details[column]
+        return resolved
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
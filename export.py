@@ -0,0 +1,100 @@
+import os
+from io import BytesIO
+import pandas as pd
+import streamlit as st
+
+
+# format -> (mime type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", ".xlsx"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+    "feather": ("application/vnd.apache.arrow.file", ".feather"),
+}
+
+FORMAT_LABELS = {
+    "CSV": "csv",
+    "Excel": "xlsx",
+    "Parquet (compressed, typed)": "parquet",
+    "Feather (Arrow)": "feather",
+}
+
+
+# --------- Serialization ---------
+def serialize(df, fmt, sheet_name="Jobs"):
+    if fmt == "csv":
+        return df.to_csv(index=False).encode("utf-8")
+
+    buffer = BytesIO()
+    if fmt == "xlsx":
+        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(buffer, index=False, compression="zstd")
+    elif fmt == "feather":
+        df.reset_index(drop=True).to_feather(buffer, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return buffer.getvalue()
+
+def format_from_path(path):
+    extension = os.path.splitext(path)[1].lower()
+    for fmt, (_, ext) in EXPORT_FORMATS.items():
+        if ext == extension:
+            return fmt
+    raise ValueError(f"Cannot tell the export format of {path}")
+
+def read_export(data, fmt=None):
+    """Load results from a DataFrame, a file path, or serialized bytes in `fmt`."""
+    if isinstance(data, pd.DataFrame):
+        return data
+    if isinstance(data, (str, os.PathLike)):
+        fmt = fmt or format_from_path(str(data))
+    elif fmt is None:
+        raise ValueError("`fmt` is required when reading serialized bytes")
+    else:
+        data = BytesIO(data)
+
+    if fmt == "csv":
+        return pd.read_csv(data)
+    if fmt == "xlsx":
+        return pd.read_excel(data)
+    if fmt == "parquet":
+        return pd.read_parquet(data)
+    if fmt == "feather":
+        return pd.read_feather(data)
+    raise ValueError(f"Unsupported export format: {fmt}")
+
+
+# --------- Cached Export ---------
+class ResultExport:
+    """Serialize one results frame at most once per format and reuse the bytes everywhere."""
+
+    def __init__(self, df, basename):
+        self.df = df
+        self.basename = basename
+        self._cache = {}
+
+    def bytes(self, fmt):
+        if fmt not in self._cache:
+            self._cache[fmt] = serialize(self.df, fmt)
+        return self._cache[fmt]
+
+    def filename(self, fmt):
+        return self.basename + EXPORT_FORMATS[fmt][1]
+
+    def save(self, fmt, directory="."):
+        path = os.path.join(directory, self.filename(fmt))
+        with open(path, "wb") as f:
+            f.write(self.bytes(fmt))
+        return path
+
+    def download_button(self, fmt, label=None, **kwargs):
+        return st.download_button(
+            label=label or f"📥 Download Results as {fmt.upper()}",
+            data=self.bytes(fmt),
+            file_name=self.filename(fmt),
+            mime=EXPORT_FORMATS[fmt][0],
+            **kwargs
+        )
+
@@ -0,0 +1,251 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import asdict, replace
+
+import pandas as pd
+import streamlit as st
+
+import gdrive_uploader
+import nhs
+import trac
+from categories import BAND_LEVELS, band_label, band_rank, categorize
+from dedupe import assign_clusters, CLUSTER_COLUMN
+from export import ResultExport, FORMAT_LABELS
+from jobs import get_job_manager, job_panel, partial_notice
+from job_filters import FilterSpec
+from reference_index import merge_sources
+
+
+SOURCE_LABELS = {"nhs": "NHS Jobs", "trac": "HealthJobsUK"}
+
+# Each source's background entry point; both take (params, progress, cancel_event)
+SOURCE_RUNNERS = {"nhs": nhs.run_search, "trac": trac.run_search}
+
+
+# --------- Mapping One Spec onto Each Source ---------
+def nhs_filters(spec, distance=None):
+    """NHS Jobs search parameters for `spec`, as nhs.main builds them from its sidebar."""
+    low = band_rank(spec.min_band) if spec.min_band is not None else None
+    high = band_rank(spec.max_band, upper=True) if spec.max_band is not None else None
+    filters = {
+        "location": spec.location,
+        "contractType": spec.contract_type,
+        "workingPattern": "full-time" if "full" in spec.working_pattern.lower() else "",
+        "language": "en",
+        "min_salary": spec.min_salary,
+    }
+    if low is not None or high is not None:
+        bands = BAND_LEVELS[low or 0:(len(BAND_LEVELS) if high is None else high + 1)]
+        filters["payBand"] = ",".join(band.upper().replace(" ", "_") for band in bands)
+    if spec.location and distance:
+        filters["distance"] = distance
+    return {k: v for k, v in filters.items() if v != "" and v is not None}
+
+def source_params(spec, num_pages=3, nhs_source="api", combine=False, time_budget=0, distance=None):
+    """Background-job params for each source's run_search, all from the one `spec`."""
+    nhs_spec = replace(spec, keywords=[])
+    # HealthJobsUK listings and detail pages carry no location, so that check is left to the query text
+    trac_spec = replace(spec, location="")
+    return {
+        "nhs": {
+            "filters": nhs_filters(spec, distance), "spec": asdict(nhs_spec), "keywords": list(spec.keywords),
+            "num_pages": int(num_pages), "source": nhs_source, "combine": combine, "time_budget": time_budget,
+        },
+        "trac": {
+            "spec": asdict(trac_spec), "pages_to_scrape": int(num_pages), "combine": combine,
+            "time_budget": time_budget,
+        },
+    }
+
+
+# --------- Merging ---------
+def merge_results(frames, failed=None):
+    """
+    One frame in the NHS column layout from whichever sources have finished,
+    one row per reference number, with clusters recomputed across sources.
+    """
+    merged = merge_sources(frames.get("nhs"), frames.get("trac"))
+    merged = assign_clusters(categorize(merged))
+    done = list(frames.values())
+    merged.attrs.update(
+        incomplete=bool(failed) or any(df.attrs.get("incomplete") for df in done),
+        skipped_pages=sum(df.attrs.get("skipped_pages", 0) for df in done),
+        skipped_details=sum(df.attrs.get("skipped_details", 0) for df in done),
+        failed_details=sum(df.attrs.get("failed_details", 0) for df in done),
+        sources=sorted(frames),
+        errors=dict(failed or {}),
+    )
+    return merged
+
+
+# --------- Federated Search ---------
+def federated_search(params, progress=None, cancel_event=None, on_merge=None, poll_seconds=0.5):
+    """
+    Run every source in `params` (see source_params) at once and merge the results.
+
+    Sources run on their own threads and hosts, each inside its own per-host
+    concurrency limit, so the search takes as long as the slowest source
+    rather than the sum. `on_merge(merged)` is called from this thread each
+    time another source finishes; `progress(fraction, message)` reports the
+    average across sources. A source that fails is reported in
+    `attrs["errors"]` and the others' results are still returned.
+    """
+    cancel_event = cancel_event or threading.Event()
+    fractions = {name: 0.0 for name in params}
+    messages = {}
+
+    def reporter(name):
+        def report(fraction, message=None):
+            fractions[name] = fraction
+            if message:
+                messages[name] = message
+        return report
+
+    frames, failed = {}, {}
+    with ThreadPoolExecutor(max_workers=len(params), thread_name_prefix="federated") as executor:
+        futures = {
+            executor.submit(SOURCE_RUNNERS[name], source, reporter(name), cancel_event): name
+            for name, source in params.items()
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=poll_seconds, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    frames[name] = future.result()
+                except Exception as e:
+                    failed[name] = str(e)
+                fractions[name] = 1.0
+            if done and on_merge is not None:
+                on_merge(merge_results(frames, failed))
+            if progress is not None:
+                progress(
+                    sum(fractions.values()) / len(fractions),
+                    " · ".join(f"{SOURCE_LABELS[name]}: {message}" for name, message in sorted(messages.items()))
+                )
+
+    return merge_results(frames, failed)
+
+def run_search(params, progress, cancel_event):
+    """Background entry point for jobs.JobManager."""
+    return federated_search(params, progress, cancel_event)
+
+
+# --------- Streamlit UI ---------
+def show_results(df, heading):
+    st.subheader(heading)
+    sources = df["Source"].value_counts() if "Source" in df.columns else pd.Series(dtype=int)
+    st.caption(" · ".join(f"{source}: {count}" for source, count in sources.items()))
+    st.dataframe(df.head(20))
+
+def main():
+    st.title("🌐 Search NHS Jobs and HealthJobsUK Together")
+
+    with st.sidebar:
+        keywords_input = st.text_input("Job Keywords (comma-separated)", value="Healthcare support worker")
+        keywords = [k.strip() for k in keywords_input.split(",") if k.strip()]
+        min_salary = st.number_input("Minimum Salary (£)", min_value=0, value=24000)
+
+        band_options = BAND_LEVELS[1:]
+        col1, col2 = st.columns(2)
+        with col1:
+            min_band = st.selectbox("Min Band", band_options, index=band_options.index("Band 3"))
+        with col2:
+            max_band = st.selectbox("Max Band", band_options, index=band_options.index("Band 5"))
+
+        contract_type = st.selectbox("Contract Type", ["Permanent", "Any"], index=0)
+        working_pattern = st.selectbox("Working Pattern", ["Full time", "Any"], index=0)
+        location = st.text_input("Location (optional, NHS Jobs only)", "")
+        distance = st.selectbox("Distance from Location (miles)", [5, 10, 20, 30, 40, 50]) if location else None
+        sponsorship_required = st.checkbox("Only show jobs that offer visa sponsorship")
+        license_filter = st.checkbox("Must Not Require Driver's License")
+
+        num_pages = st.number_input("Pages per source", min_value=1, max_value=50, value=3)
+        time_budget = st.number_input("Time budget (minutes, 0 = no limit)", min_value=0, value=0)
+        combine_queries = st.checkbox("Combine keywords into fewer searches", value=False,
+                                      help="Each keyword keeps its own page budget.")
+        export_format = FORMAT_LABELS[st.selectbox("Export Format", list(FORMAT_LABELS), index=0)]
+        background = st.checkbox("Run in background", help="Queue the search on the shared worker pool; "
+                                 "attach to it again from any session.")
+        search_clicked = st.button("🔎 Search Both Sites")
+
+    if band_rank(min_band) > band_rank(max_band):
+        st.warning("⚠️ Minimum band must be less than or equal to maximum band.")
+        return
+
+    finished = job_panel("federated", "federated_job_id")
+    if finished is not None and not search_clicked:
+        st.session_state["df_federated"] = finished
+        show_results(finished, f"Results ({len(finished)} unique jobs from background search)")
+        partial_notice(finished.attrs)
+        ResultExport(finished, "all_jobs").download_button(export_format)
+
+    if search_clicked:
+        spec = FilterSpec(
+            keywords=keywords,
+            min_salary=min_salary,
+            min_band=band_label(min_band),
+            max_band=band_label(max_band),
+            contract_type="" if contract_type == "Any" else contract_type,
+            working_pattern="" if working_pattern == "Any" else working_pattern,
+            location=location,
+            sponsorship="Offered" if sponsorship_required else None,
+            license="Does Not Require License" if license_filter else None
+        )
+        params = source_params(spec, num_pages, combine=combine_queries, time_budget=int(time_budget) * 60,
+                               distance=distance)
+        if background:
+            st.session_state["federated_job_id"] = get_job_manager().submit(
+                "federated", params, label=", ".join(keywords)
+            )
+            st.rerun()
+
+        bar = st.progress(0.0, text="Searching both sites...")
+        table = st.empty()
+
+        def show_partial(merged):
+            with table.container():
+                show_results(merged, f"{len(merged)} jobs so far from {', '.join(merged.attrs['sources'])}")
+
+        df = federated_search(
+            params, progress=lambda fraction, message: bar.progress(fraction, text=message or "Searching..."),
+            on_merge=show_partial
+        )
+        bar.empty()
+        table.empty()
+        for name, error in df.attrs["errors"].items():
+            st.error(f"❌ {SOURCE_LABELS[name]} search failed: {error}")
+        partial_notice(df.attrs)
+
+        st.session_state["df_federated"] = df
+        if df.empty:
+            st.warning("No jobs found on either site for these keywords and filters.")
+        else:
+            show_results(df, f"Results ({len(df)} unique jobs across both sites)")
+            st.caption(f"{df[CLUSTER_COLUMN].nunique()} distinct roles after grouping near-duplicate adverts.")
+            ResultExport(df, "all_jobs").download_button(export_format)
+
+    # -------------------- Upload to Google Drive --------------------
+    if "df_federated" in st.session_state:
+        st.markdown("---")
+        st.subheader("📤 Upload to Google Drive")
+        category = st.selectbox("Job Category", [
+            "Admin",
+            "Healthcare",
+            "Business (PM, BA)",
+            "Finance",
+            "Tech"
+        ], index=None, placeholder="Choose a category")
+
+        if category and st.button("📤 Upload to Drive"):
+            try:
+                message = gdrive_uploader.upload_to_drive(st.session_state["df_federated"], category, prefix="all")
+                st.success("✅ Upload completed successfully!")
+                st.caption(message)
+            except Exception as e:
+                st.error(f"❌ Upload failed: {str(e)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,36 @@
 import pandas as pd
+import random
+import threading
+import time
+from concurrent.futures import Future
 from io import BytesIO
 import streamlit as st
+import xlsxwriter
+from openpyxl import load_workbook
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+from export import read_export
+from dedupe import assign_clusters, CLUSTER_COLUMN
+from delta import CHANGE_LOG_SHEET, apply_delta, coalesce_updates, compute_delta, load_snapshot, save_snapshot
+
+try:
+    import python_calamine  # noqa: F401  (optional, much faster sheet reads)
+    READ_ENGINE = "calamine"
+except ImportError:
+    READ_ENGINE = "openpyxl"
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# constant_memory flushes each row to a temp file as soon as it is written
+WORKBOOK_OPTIONS = {"constant_memory": True, "default_date_format": "yyyy-mm-dd"}
+
+# Attempts at a version-checked write before giving up on a busy workbook
+WRITE_ATTEMPTS = 5
+
+
+class WriteConflictError(RuntimeError):
+    """The workbook kept changing underneath us for every write attempt."""
 
 
 # -------------------- AUTH & DRIVE SERVICE --------------------
@@ -22,18 +49,43 @@ def get_drive_service():
 
 # -------------------- FILE & SHEET HELPERS --------------------
 
-def get_today_filename():
+def get_today_filename(prefix=None):
     import datetime
-    return datetime.date.today().isoformat() + ".xlsx"
+    stem = datetime.date.today().isoformat()
+    return f"{prefix}_{stem}.xlsx" if prefix else stem + ".xlsx"
 
 
-def find_file(service, filename):
+def _find_file_request(service, filename):
     query = f"name = '{filename}' and mimeType = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'"
-    results = service.files().list(q=query, fields="files(id, name)").execute()
+    return service.files().list(q=query, fields="files(id, name)")
+
+
+def find_file(service, filename):
+    results = _find_file_request(service, filename).execute()
     files = results.get("files", [])
     return files[0] if files else None
 
 
+def find_files(service, filenames):
+    """Look up several workbooks through one Drive batch request; returns {filename: file or None}."""
+    found, errors = {}, []
+
+    def collect(request_id, response, exception):
+        if exception is not None:
+            errors.append(exception)
+        else:
+            files = response.get("files", [])
+            found[request_id] = files[0] if files else None
+
+    batch = service.new_batch_http_request(callback=collect)
+    for filename in filenames:
+        batch.add(_find_file_request(service, filename), request_id=filename)
+    batch.execute()
+    if errors:
+        raise errors[0]
+    return found
+
+
 def normalize_date_column(df, column_name):
     if column_name in df.columns:
         df[column_name] = pd.to_datetime(df[column_name], errors="coerce")
@@ -41,67 +93,292 @@ def normalize_date_column(df, column_name):
     return df
 
 
-# -------------------- UPLOAD / UPDATE FILE --------------------
+# -------------------- STREAMING SHEET WRITERS --------------------
 
-def upload_new_file_with_sheet(service, df, filename, sheet_name):
-    buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
-    buffer.seek(0)
+def _cell_value(value):
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
 
-    media = MediaIoBaseUpload(buffer, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    file_metadata = {'name': filename, 'mimeType': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
-    service.files().create(body=file_metadata, media_body=media, fields='id').execute()
 
+def write_frame_to_sheet(workbook, sheet_name, df):
+    # Rows go out strictly in order, which constant_memory mode requires
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(column) for column in df.columns])
+    for row_index, row in enumerate(df.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(row_index, 0, [_cell_value(value) for value in row])
 
-def update_existing_file_by_sheet(service, file_id, new_df, sheet_name):
+
+def copy_sheet(workbook, source_sheet, sheet_name):
+    # Stream cell values across without building a DataFrame for sheets we don't touch
+    worksheet = workbook.add_worksheet(sheet_name)
+    for row_index, values in enumerate(source_sheet.iter_rows(values_only=True)):
+        worksheet.write_row(row_index, 0, values)
+
+
+def download_file(service, file_id):
     request = service.files().get_media(fileId=file_id)
     fh = BytesIO()
     downloader = MediaIoBaseDownload(fh, request)
     done = False
     while not done:
         status, done = downloader.next_chunk()
-    fh.seek(0)
+    return fh.getvalue()
+
+
+def read_sheet(data, sheet_name):
+    return pd.read_excel(BytesIO(data), sheet_name=sheet_name, engine=READ_ENGINE)
+
+
+def read_sheets(data, sheet_names):
+    # One pass over the workbook for every sheet we need, instead of one per sheet
+    if not sheet_names:
+        return {}
+    return pd.read_excel(BytesIO(data), sheet_name=list(sheet_names), engine=READ_ENGINE)
 
-    # Load all sheets
-    existing_sheets = pd.read_excel(fh, sheet_name=None)
 
-    # Normalize both old and new data
-    if sheet_name in existing_sheets:
-        existing_df = normalize_date_column(existing_sheets[sheet_name], "Date Posted")
-    else:
-        existing_df = pd.DataFrame()
+# -------------------- UPLOAD / UPDATE FILE --------------------
+
+def merge_sheet(sheet_name, existing_df, new_df):
+    if sheet_name == CHANGE_LOG_SHEET:
+        # Idempotent, so a retried merge doesn't log the same change twice
+        return pd.concat([existing_df, new_df], ignore_index=True).drop_duplicates()
 
+    existing_df = normalize_date_column(existing_df, "Date Posted")
     new_df = normalize_date_column(new_df, "Date Posted")
-    updated_df = pd.concat([existing_df, new_df]).drop_duplicates()
+    # Cluster IDs are per run, so drop them before merging and recompute them
+    # over the whole sheet to group re-posts across runs too
+    updated_df = apply_delta(
+        existing_df.drop(columns=CLUSTER_COLUMN, errors="ignore"),
+        new_df.drop(columns=CLUSTER_COLUMN, errors="ignore")
+    )
+    return assign_clusters(updated_df.reset_index(drop=True))
+
+
+def upload_new_file(service, updates, filename):
+    buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, WORKBOOK_OPTIONS)
+    for sheet_name, df in updates.items():
+        write_frame_to_sheet(workbook, sheet_name, df)
+    workbook.close()
+    buffer.seek(0)
+
+    media = MediaIoBaseUpload(buffer, mimetype=XLSX_MIME)
+    file_metadata = {'name': filename, 'mimeType': XLSX_MIME}
+    service.files().create(body=file_metadata, media_body=media, fields='id').execute()
 
-    # Write all sheets back, updating the selected one
+
+def get_version(service, file_id):
+    return int(service.files().get(fileId=file_id, fields="version").execute()["version"])
+
+
+def merge_workbook(data, updates):
+    """Merge `updates` ({sheet name: frame}) into workbook bytes and return the new workbook."""
+    # Only the updated sheets are parsed into DataFrames; the rest are copied through
+    source = load_workbook(BytesIO(data), read_only=True, data_only=True)
+    sheet_names = source.sheetnames
+
+    existing = read_sheets(data, [sheet for sheet in sheet_names if sheet in updates])
+
+    def merged(sheet):
+        return merge_sheet(sheet, existing.get(sheet, pd.DataFrame()), updates[sheet])
+
+    # Write all sheets back in their original order, replacing the updated ones
     buffer = BytesIO()
-    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-        for sheet, df in existing_sheets.items():
-            if sheet != sheet_name:
-                df.to_excel(writer, sheet_name=sheet, index=False)
-        updated_df.to_excel(writer, sheet_name=sheet_name, index=False)
+    workbook = xlsxwriter.Workbook(buffer, WORKBOOK_OPTIONS)
+    for sheet in sheet_names:
+        if sheet in updates:
+            write_frame_to_sheet(workbook, sheet, merged(sheet))
+        else:
+            copy_sheet(workbook, source[sheet], sheet)
+    for sheet in updates:
+        if sheet not in sheet_names:
+            write_frame_to_sheet(workbook, sheet, merged(sheet))
+    workbook.close()
+    source.close()
 
     buffer.seek(0)
+    return buffer
+
+
+def update_existing_file(service, file_id, updates, attempts=WRITE_ATTEMPTS):
+    """
+    Merge `updates` into the file with a version-checked write.
+
+    The file's version is read before downloading and checked again just
+    before uploading; if anyone wrote in between, the merge is redone on top
+    of their version instead of overwriting it. A write that lands between
+    that check and ours shows up as a version that moved by more than one,
+    and the merge is redone on top of the result.
+    """
+    for attempt in range(attempts):
+        version = get_version(service, file_id)
+        buffer = merge_workbook(download_file(service, file_id), updates)
+        if get_version(service, file_id) == version:
+            media = MediaIoBaseUpload(buffer, mimetype=XLSX_MIME)
+            written = service.files().update(fileId=file_id, media_body=media, fields="version").execute()
+            if int(written["version"]) == version + 1:
+                return attempt + 1
+        time.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+    raise WriteConflictError(f"Workbook {file_id} changed during each of {attempts} write attempts")
 
-    media = MediaIoBaseUpload(buffer, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    service.files().update(fileId=file_id, media_body=media).execute()
+
+def upload_new_file_with_sheet(service, df, filename, sheet_name):
+    upload_new_file(service, {sheet_name: df}, filename)
+
+
+def update_existing_file_by_sheet(service, file_id, new_df, sheet_name):
+    update_existing_file(service, file_id, {sheet_name: new_df})
 
 
 # -------------------- MAIN UPLOAD FUNCTION --------------------
 
-def upload_to_drive(df, category, prefix=None):
-    filename = get_today_filename(prefix)
+def describe_changes(change_log, total_rows):
+    counts = change_log["Change"].value_counts()
+    summary = ", ".join(f"{counts.get(kind, 0)} {kind}" for kind in ("new", "changed", "closed"))
+    return f"Sent {len(change_log)} change(s) out of {total_rows} row(s): {summary}."
+
+
+# -------------------- COALESCING WRITE QUEUE --------------------
+
+class WorkbookWriteQueue:
+    """
+    Group concurrent uploads to the same workbook into one write.
+
+    Every session queues its updates under the workbook's filename. Whoever
+    holds the file's lock takes everything queued so far, merges it into a
+    single update and writes it; sessions whose updates went out with that
+    write just collect the result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._file_locks = {}
+
+    def submit(self, service, filename, updates, file_info=None):
+        future = Future()
+        with self._lock:
+            self._pending.setdefault(filename, []).append((updates, future))
+            file_lock = self._file_locks.setdefault(filename, threading.Lock())
+
+        with file_lock:
+            with self._lock:
+                batch = self._pending.pop(filename, [])
+            if batch:
+                try:
+                    result = self._write(service, filename, coalesce_updates([u for u, _ in batch]), file_info)
+                except Exception as e:
+                    for _, pending in batch:
+                        pending.set_exception(e)
+                else:
+                    for _, pending in batch:
+                        pending.set_result(result)
+        return future.result()
+
+    def _write(self, service, filename, updates, file_info):
+        # Check again under the lock: another session may have created today's file since
+        file_info = file_info or find_file(service, filename)
+        if file_info:
+            update_existing_file(service, file_info['id'], updates)
+            return "updated"
+        upload_new_file(service, updates, filename)
+        return "created"
+
+
+_write_queue = WorkbookWriteQueue()
+
+
+def prepare_updates(frames, filename, fmt=None, delta=True, exists=True):
+    """
+    Turn {category: results} into the sheet updates for the workbook `filename`.
+
+    Snapshots are kept per workbook and category, so the first upload into a
+    new daily workbook (or one that was deleted, `exists=False`) sends every
+    row. Returns `(updates, messages, snapshots)`; `snapshots` are saved once
+    the upload has gone through.
+    """
+    updates, messages, snapshots, change_logs = {}, {}, {}, []
+    for category, df in frames.items():
+        # Normalize and clean up date
+        df = normalize_date_column(read_export(df, fmt), "Date Posted")
+        if not delta:
+            updates[category] = df
+            messages[category] = f"Sent all {len(df)} row(s)."
+            continue
+
+        snapshot_name = f"{filename.rsplit('.', 1)[0]}_{category}"
+        snapshot = load_snapshot(snapshot_name)
+        if not exists:
+            snapshot = snapshot.iloc[0:0]
+        delta_df, change_log, new_snapshot = compute_delta(df, snapshot)
+        if delta_df.empty:
+            messages[category] = f"No changes since the last '{category}' upload — nothing was sent."
+            continue
+        updates[category] = delta_df
+        change_logs.append(change_log.assign(Category=category))
+        snapshots[snapshot_name] = new_snapshot
+        messages[category] = describe_changes(change_log, len(df))
+
+    if change_logs:
+        updates[CHANGE_LOG_SHEET] = pd.concat(change_logs, ignore_index=True)
+    return updates, messages, snapshots
+
+
+def upload_batches(batches, fmt=None, delta=True):
+    """
+    Upload {prefix: {category: results}} with one read-modify-write cycle per
+    daily workbook, finding all the workbooks through one batch request.
+    Returns {prefix: {category: message}}.
+    """
+    filenames = {prefix: get_today_filename(prefix) for prefix in batches}
     service = get_drive_service()
-    file_info = find_file(service, filename)
+    existing_files = find_files(service, filenames.values())
+    prepared = {
+        prefix: prepare_updates(
+            frames, filenames[prefix], fmt, delta, exists=existing_files.get(filenames[prefix]) is not None
+        )
+        for prefix, frames in batches.items()
+    }
+
+    results = {}
+    for prefix, (updates, messages, snapshots) in prepared.items():
+        results[prefix] = messages
+        if not updates:
+            continue
+        file_info = existing_files.get(filenames[prefix])
+        categories = ", ".join(f"'{c}'" for c in updates if c != CHANGE_LOG_SHEET)
+        if _write_queue.submit(service, filenames[prefix], updates, file_info) == "updated":
+            st.success(f"File updated successfully under {categories} sheet(s)!")
+        else:
+            st.success(f"New Excel file created with {categories} sheet(s)!")
+
+        # Only once the upload has gone through, so a failed upload is retried in full
+        for snapshot_name, snapshot in snapshots.items():
+            save_snapshot(snapshot_name, snapshot)
+    return results
+
+
+def upload_many(frames, prefix=None, fmt=None, delta=True):
+    """Upload {category: results} into today's workbook in one download and upload."""
+    return upload_batches({prefix: frames}, fmt, delta)[prefix]
+
 
-    # Normalize and clean up date
-    df = normalize_date_column(df, "Date Posted")
+def upload_to_drive(df, category, prefix=None, fmt=None, delta=True):
+    """
+    Upload results into the `category` sheet of today's workbook.
 
-    if file_info:
-        update_existing_file_by_sheet(service, file_info['id'], df, category)
-        st.success(f"File updated successfully under '{category}' sheet!")
-    else:
-        upload_new_file_with_sheet(service, df, filename, category)
-        st.success(f"New Excel file created with '{category}' sheet!")
+    `df` may be a DataFrame, a path to an exported file, or exported bytes
+    (CSV, Excel, Parquet or Feather) with `fmt` naming the format. With
+    `delta`, only adverts that are new, changed or closed since the last
+    upload to this category of today's workbook are sent, together with a
+    Change Log sheet.
+    """
+    return upload_many({category: df}, prefix, fmt, delta)[category]
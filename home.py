@@ -3,9 +3,9 @@ import streamlit as st
 # Navigation menu
 st.set_page_config(page_title="NHS Scraper App", page_icon="🔍")
 st.sidebar.title("📂 Navigation")
-page = st.sidebar.selectbox("Choose a scraper", ["🏠 Home", "🧰 Trac Jobs", "💼 NHS Jobs"])
+page = st.sidebar.selectbox("Choose a scraper", ["🏠 Home", "🧰 Trac Jobs", "💼 NHS Jobs", "🌐 All Sources"])
 
-# Route to correct module
+# Route to correct module (imports are cached, so each page renders through its main())
 if page == "🏠 Home":
     st.title("🔍 NHS Job Scraper Hub")
     st.markdown("""
@@ -14,10 +14,17 @@ Welcome to the **NHS Job Scraper Hub**.
 Use the menu on the left to switch between:
 - 🧰 Trac Jobs
 - 💼 NHS Jobs
+- 🌐 All Sources (both sites in one search)
 """)
 
 elif page == "🧰 Trac Jobs":
     import trac
+    trac.main()
 
 elif page == "💼 NHS Jobs":
     import nhs
+    nhs.main()
+
+elif page == "🌐 All Sources":
+    import federated
+    federated.main()
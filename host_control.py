@@ -0,0 +1,313 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+
+HOST_LIMITS_PATH = os.environ.get("HOST_LIMITS_PATH", os.path.join(tempfile.gettempdir(), "host_limits.json"))
+
+# Upper bound on concurrent requests to one host; pools are sized to this
+# and the per-host limit decides how many of those threads may send at once.
+MAX_CONCURRENCY = 32
+INITIAL_CONCURRENCY = 4
+
+# Responses that mean "slow down" rather than "this page is broken"
+THROTTLE_STATUSES = (429, 503)
+
+# Consecutive failures (errors, throttling or latency spikes) that open a host's circuit
+FAILURE_THRESHOLD = 5
+# An open circuit rejects requests this long before one probe is let through;
+# each failed probe doubles it up to MAX_OPEN_SECONDS
+OPEN_SECONDS = 15.0
+MAX_OPEN_SECONDS = 300.0
+
+# Timeouts used until a host has MIN_SAMPLES latencies, and the bounds tuning keeps to
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10.0
+MIN_CONNECT_TIMEOUT = 1.0
+MIN_READ_TIMEOUT = 2.0
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+
+
+# --------- Per-Host AIMD Limit ---------
+class AdaptiveLimit:
+    """
+    Additive-increase / multiplicative-decrease concurrency limit for one host.
+
+    Every healthy response (2xx-4xx other than 429, within
+    `latency_tolerance` times the host's usual latency) grows the limit by
+    1/limit, so it rises by about one per round of requests. A timeout,
+    connection error, 429, 5xx or latency spike halves it, at most once per
+    round so one burst of failures only counts once.
+    """
+
+    def __init__(self, host, initial=INITIAL_CONCURRENCY, min_limit=1, max_limit=MAX_CONCURRENCY,
+                 latency_tolerance=2.0, backoff=0.5):
+        self.host = host
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.baseline = None  # moving average of healthy latency, seconds
+        self.in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self._last_cut = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency, ok):
+        with self._cond:
+            self.in_flight -= 1
+            slow = ok and self.baseline is not None and latency > self.baseline * self.latency_tolerance
+
+            if ok and not slow:
+                self.successes += 1
+                self.baseline = latency if self.baseline is None else 0.9 * self.baseline + 0.1 * latency
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                self.failures += int(not ok)
+                now = time.monotonic()
+                if now - self._last_cut >= max(self.baseline or 0.0, 1.0):
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_cut = now
+            self._cond.notify_all()
+
+    def cancel(self):
+        """Give back a slot that was acquired but never used for a request."""
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def snapshot(self):
+        return {
+            "limit": int(self.limit),
+            "baseline_ms": round(self.baseline * 1000) if self.baseline is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "updated": time.time(),
+        }
+
+
+# --------- Per-Host Circuit Breaker ---------
+class HostUnavailable(requests.ConnectionError):
+    """Raised instead of sending a request while the host's circuit is open."""
+
+
+class RequestSkipped(Exception):
+    """Raised instead of sending a request whose search stopped while it waited for a slot."""
+
+
+class CircuitBreaker:
+    """
+    Fails requests to a degraded host immediately instead of letting each one
+    wait out its timeout.
+
+    FAILURE_THRESHOLD consecutive failures open the circuit, and requests then
+    raise HostUnavailable. Failures include errors, throttling and latencies
+    beyond `spike_factor` times the host's p95. Once the cool-down passes, a
+    single half-open probe goes through: success closes the circuit, failure
+    reopens it for twice as long.
+
+    The window of healthy latencies also sets the host's timeouts: connect
+    from the median, read from the p99, each within fixed bounds.
+    """
+
+    def __init__(self, host, read_timeout=READ_TIMEOUT, failure_threshold=FAILURE_THRESHOLD,
+                 open_seconds=OPEN_SECONDS, spike_factor=3.0):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.base_open_seconds = open_seconds
+        self.spike_factor = spike_factor
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.trips = 0
+        self._open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probing = False
+        self._initial_read_timeout = min(max(read_timeout, MIN_READ_TIMEOUT), READ_TIMEOUT)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def _percentile(self, q):
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def timeouts(self):
+        """(connect, read) timeouts for the next request to this host."""
+        with self._lock:
+            if len(self._latencies) < MIN_SAMPLES:
+                return CONNECT_TIMEOUT, self._initial_read_timeout
+            connect = min(max(2 * self._percentile(0.5), MIN_CONNECT_TIMEOUT), CONNECT_TIMEOUT)
+            read = min(max(3 * self._percentile(0.99), MIN_READ_TIMEOUT), READ_TIMEOUT)
+            return round(connect, 2), round(read, 2)
+
+    def latency(self, q=0.5):
+        """The `q` percentile of recent healthy latencies, or None before any were seen."""
+        with self._lock:
+            return self._percentile(q) if self._latencies else None
+
+    def is_open(self):
+        with self._lock:
+            return self.state == "open" and time.monotonic() < self._open_until
+
+    def before_request(self):
+        """Raise HostUnavailable unless a request may go out now; may claim the half-open probe."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() >= self._open_until:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return
+            raise HostUnavailable(f"{self.host} is failing; circuit open")
+
+    def record(self, ok, latency=None):
+        with self._lock:
+            spike = (
+                ok and latency is not None and len(self._latencies) >= MIN_SAMPLES
+                and latency > self.spike_factor * self._percentile(0.95)
+            )
+            if ok and not spike:
+                self._latencies.append(latency)
+                self.consecutive_failures = 0
+                if self.state != "closed":
+                    self.state, self._probing = "closed", False
+                    self._open_seconds = self.base_open_seconds
+                return
+
+            self.consecutive_failures += 1
+            if self.state == "half_open":
+                self._open_seconds = min(self._open_seconds * 2, MAX_OPEN_SECONDS)
+                self._trip()
+            elif self.state == "closed" and self.consecutive_failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        self.state, self._probing = "open", False
+        self._open_until = time.monotonic() + self._open_seconds
+        self.trips += 1
+
+    def snapshot(self):
+        connect, read = self.timeouts()
+        return {"state": self.state, "trips": self.trips, "connect_timeout": connect, "read_timeout": read}
+
+
+# --------- Registry ---------
+_limits = {}
+_breakers = {}
+_registry_lock = threading.Lock()
+
+def _load_levels():
+    try:
+        with open(HOST_LIMITS_PATH) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def host_limit(url):
+    """The shared limit for `url`'s host, starting from the level it last ran at."""
+    host = urlsplit(url).netloc
+    with _registry_lock:
+        if host not in _limits:
+            recorded = _load_levels().get(host, {})
+            _limits[host] = AdaptiveLimit(host, initial=recorded.get("limit", INITIAL_CONCURRENCY))
+        return _limits[host]
+
+def host_breaker(url):
+    """The shared circuit breaker for `url`'s host, starting from the read timeout it last used."""
+    host = urlsplit(url).netloc
+    with _registry_lock:
+        if host not in _breakers:
+            recorded = _load_levels().get(host, {})
+            _breakers[host] = CircuitBreaker(host, read_timeout=recorded.get("read_timeout", READ_TIMEOUT))
+        return _breakers[host]
+
+def host_levels():
+    with _registry_lock:
+        levels = {host: limit.snapshot() for host, limit in _limits.items()}
+        for host, breaker in _breakers.items():
+            levels.setdefault(host, {}).update(breaker.snapshot())
+        return levels
+
+def tripped_hosts():
+    """Hosts whose circuit has opened at least once in this process."""
+    with _registry_lock:
+        return sorted(host for host, breaker in _breakers.items() if breaker.trips)
+
+_levels_lock = threading.Lock()
+
+def record_levels():
+    """Persist each host's current limit so the next run starts there instead of at the default."""
+    with _levels_lock:
+        levels = _load_levels()
+        levels.update(host_levels())
+        # A temp file of our own, so scrapes finishing together (or in other worker processes) never share one
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(HOST_LIMITS_PATH) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(levels, f, indent=2)
+            os.replace(tmp_path, HOST_LIMITS_PATH)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return levels
+
+
+# --------- Request Helpers ---------
+def limited_get(session, url, stopped=None, **kwargs):
+    """
+    `session.get(url)` inside the host's concurrency limit and circuit
+    breaker; `session` may be the requests module. Without an explicit
+    `timeout` the host's tuned (connect, read) pair is used. Raises
+    HostUnavailable, a requests.ConnectionError, while the circuit is open,
+    and RequestSkipped when `stopped()` is true by the time a slot is free.
+    """
+    breaker = host_breaker(url)
+    if breaker.is_open():
+        raise HostUnavailable(f"{breaker.host} is failing; circuit open")
+    limit = host_limit(url)
+    limit.acquire()
+    try:
+        # The search may have stopped, or the circuit opened, while this request queued for a slot.
+        # Stopped is checked first: before_request may claim the half-open probe, which only
+        # record() gives back, so nothing may skip the request after it
+        if stopped is not None and stopped():
+            raise RequestSkipped(url)
+        breaker.before_request()
+    except (HostUnavailable, RequestSkipped):
+        limit.cancel()
+        raise
+
+    kwargs.setdefault("timeout", breaker.timeouts())
+    start = time.monotonic()
+    ok = False
+    latency = None
+    try:
+        response = session.get(url, **kwargs)
+        ok = response.status_code < 500 and response.status_code not in THROTTLE_STATUSES
+        latency = response.elapsed.total_seconds()
+        return response
+    finally:
+        limit.release(time.monotonic() - start, ok)
+        breaker.record(ok, latency)
+
+def mount_pool(session, pool_size=MAX_CONCURRENCY):
+    """Size the session's connection pool so raised limits actually reuse connections."""
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
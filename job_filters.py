@@ -0,0 +1,149 @@
+from dataclasses import dataclass, field
+from rapidfuzz.fuzz import partial_ratio
+
+from categories import BAND_RANKS, band_rank
+
+
+# Relative cost of each kind of check; cheaper checks run first
+COST_NUMERIC = 1
+COST_TEXT = 2
+COST_FUZZY = 3
+
+# Canonical job fields the predicates read — the matching JobRecord
+# attributes, or the same keys on a plain dict.
+JOB_FIELDS = (
+    "title", "min_salary", "band", "contract_type", "working_pattern",
+    "location", "sponsorship", "license"
+)
+
+
+# --------- Filter Specification ---------
+@dataclass
+class FilterSpec:
+    keywords: list = field(default_factory=list)
+    min_salary: int = 0
+    min_band: object = None   # band label ("Band 8a", "BAND_8A") or number; a bare 8 spans 8a-8d
+    max_band: object = None
+    contract_type: str = ""
+    working_pattern: str = ""
+    location: str = ""
+    sponsorship: str = None   # "Offered" | "Not Offered"
+    license: str = None       # "Requires License" | "Does Not Require License"
+    fuzzy_threshold: int = 70
+
+
+@dataclass(frozen=True)
+class Predicate:
+    name: str
+    field: str
+    cost: int
+    test: object
+
+    def __call__(self, job):
+        if isinstance(job, dict):
+            return self.test(job.get(self.field))
+        return self.test(getattr(job, self.field, None))
+
+
+# --------- Predicate Builders ---------
+def _contains(expected):
+    expected = expected.lower()
+    return lambda value: bool(value) and expected in value.lower()
+
+def _band_between(low, high):
+    def test(value):
+        # Canonical labels are a dict hit; only other spellings go through the regex
+        rank = BAND_RANKS.get(value)
+        if rank is None:
+            rank = band_rank(value)
+        return rank is not None and low <= rank <= high
+    return test
+
+def _build_predicates(spec):
+    predicates = []
+
+    if spec.min_salary:
+        predicates.append(Predicate(
+            "min_salary", "min_salary", COST_NUMERIC,
+            lambda value: bool(value) and value >= spec.min_salary
+        ))
+    if spec.min_band is not None or spec.max_band is not None:
+        # Compared as ranks in the ordered band levels, so 8a < 8b < 8c < 8d
+        low = band_rank(spec.min_band) if spec.min_band is not None else 0
+        high = band_rank(spec.max_band, upper=True) if spec.max_band is not None else 99
+        predicates.append(Predicate("band", "band", COST_NUMERIC, _band_between(low, high)))
+    if spec.contract_type:
+        predicates.append(Predicate("contract_type", "contract_type", COST_TEXT, _contains(spec.contract_type)))
+    if spec.working_pattern:
+        predicates.append(Predicate("working_pattern", "working_pattern", COST_TEXT, _contains(spec.working_pattern)))
+    if spec.location:
+        predicates.append(Predicate("location", "location", COST_TEXT, _contains(spec.location)))
+    if spec.keywords:
+        keywords = [kw.lower() for kw in spec.keywords]
+        predicates.append(Predicate(
+            "keywords", "title", COST_FUZZY,
+            lambda value: bool(value) and any(
+                partial_ratio(value.lower(), kw) >= spec.fuzzy_threshold for kw in keywords
+            )
+        ))
+    if spec.sponsorship == "Offered":
+        predicates.append(Predicate("sponsorship", "sponsorship", COST_TEXT, lambda value: value != "Not Offered"))
+    elif spec.sponsorship == "Not Offered":
+        predicates.append(Predicate(
+            "sponsorship", "sponsorship", COST_TEXT, lambda value: value not in ("Offered", "Likely Offered")
+        ))
+    # NHS Jobs labels licence as "Yes"/"No" rather than FilterSpec's values
+    if spec.license == "Requires License":
+        predicates.append(Predicate("license", "license", COST_TEXT, lambda value: value != "Does Not Require License"))
+    elif spec.license == "Does Not Require License":
+        predicates.append(Predicate(
+            "license", "license", COST_TEXT, lambda value: value not in ("Requires License", "Yes")
+        ))
+
+    return predicates
+
+
+# --------- Compiled Pipeline ---------
+class FilterPipeline:
+    """
+    A FilterSpec compiled for one source.
+
+    `listing_checks` only read fields the listing page provides and run before
+    any network request; `detail_checks` need the detail page. Both are
+    ordered by cost and short-circuit on the first failure.
+    """
+
+    def __init__(self, listing_checks, detail_checks):
+        self.listing_checks = listing_checks
+        self.detail_checks = detail_checks
+
+    @property
+    def needs_detail(self):
+        return bool(self.detail_checks)
+
+    def passes_listing(self, job):
+        return all(check(job) for check in self.listing_checks)
+
+    def passes_detail(self, job):
+        return all(check(job) for check in self.detail_checks)
+
+    def passes(self, job):
+        return self.passes_listing(job) and self.passes_detail(job)
+
+
+def compile_filters(spec, listing_fields, upstream_fields=()):
+    """
+    Compile `spec` for a source whose listing rows carry `listing_fields`.
+
+    Checks on `upstream_fields` are dropped because the source's own search
+    query already enforces them.
+    """
+    listing_checks, detail_checks = [], []
+    for predicate in sorted(_build_predicates(spec), key=lambda p: p.cost):
+        if predicate.field in upstream_fields:
+            continue
+        if predicate.field in listing_fields:
+            listing_checks.append(predicate)
+        else:
+            detail_checks.append(predicate)
+    return FilterPipeline(listing_checks, detail_checks)
@@ -0,0 +1,209 @@
+import importlib
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import streamlit as st
+
+
+JOB_DIR = os.environ.get("SCRAPE_JOB_DIR", os.path.join(tempfile.gettempdir(), "scrape_jobs"))
+MAX_BACKGROUND_SEARCHES = int(os.environ.get("SCRAPE_JOB_WORKERS", "2"))
+
+# kind -> "module:function"; each runner takes (params, progress, cancel_event) and returns a DataFrame
+RUNNERS = {
+    "nhs": "nhs:run_search",
+    "trac": "trac:run_search",
+    "federated": "federated:run_search",
+}
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def _resolve_runner(kind):
+    module_name, function_name = RUNNERS[kind].split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+# --------- Job Manager ---------
+class JobManager:
+    """
+    Run searches on one bounded worker pool shared by every Streamlit session.
+
+    Each job's status is kept as JSON next to its Parquet results under
+    `job_dir`, so any session — or a fresh process after a restart — can
+    poll, attach to or collect it by ID.
+    """
+
+    def __init__(self, max_workers=MAX_BACKGROUND_SEARCHES, job_dir=JOB_DIR):
+        self.job_dir = job_dir
+        os.makedirs(job_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape-job")
+        self._futures = {}
+        self._cancel_events = {}
+        self._lock = threading.Lock()
+
+    # --------- Persistence ---------
+    def _status_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def _result_path(self, job_id):
+        return os.path.join(self.job_dir, f"{job_id}.parquet")
+
+    def _write_status(self, job_id, **changes):
+        with self._lock:
+            status = self._read_status(job_id) or {}
+            status.update(changes, updated=time.time())
+            tmp_path = self._status_path(job_id) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(status, f, default=str)
+            os.replace(tmp_path, self._status_path(job_id))
+        return status
+
+    def _read_status(self, job_id):
+        try:
+            with open(self._status_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    # --------- Public API ---------
+    def submit(self, kind, params, label=""):
+        job_id = uuid.uuid4().hex[:12]
+        self._write_status(
+            job_id, id=job_id, kind=kind, label=label, params=params,
+            state="queued", progress=0.0, message="Waiting for a free worker", created=time.time()
+        )
+        cancel_event = threading.Event()
+        with self._lock:
+            self._cancel_events[job_id] = cancel_event
+            self._futures[job_id] = self._executor.submit(self._run, job_id, kind, params, cancel_event)
+        return job_id
+
+    def _run(self, job_id, kind, params, cancel_event):
+        if cancel_event.is_set():
+            return
+        self._write_status(job_id, state="running", message="Searching")
+
+        def progress(fraction, message=None):
+            changes = {"progress": min(max(fraction, 0.0), 1.0)}
+            if message:
+                changes["message"] = message
+            self._write_status(job_id, **changes)
+
+        try:
+            df = _resolve_runner(kind)(params, progress, cancel_event)
+            df.to_parquet(self._result_path(job_id), index=False)
+            state = "cancelled" if cancel_event.is_set() else "done"
+            message = "Finished"
+            if state == "cancelled":
+                message = "Partial results kept"
+            elif df.attrs.get("incomplete"):
+                message = f"Time budget reached; {df.attrs.get('skipped_pages', 0)} page(s) skipped"
+            self._write_status(job_id, state=state, progress=1.0, rows=len(df), message=message,
+                               skipped_pages=df.attrs.get("skipped_pages", 0))
+        except Exception as e:
+            self._write_status(job_id, state="failed", message=str(e))
+
+    def status(self, job_id):
+        status = self._read_status(job_id)
+        if status and status["state"] in ACTIVE_STATES and job_id not in self._futures:
+            # Started by a process that no longer exists
+            status = self._write_status(job_id, state="interrupted", message="Worker process restarted")
+        return status
+
+    def result(self, job_id):
+        path = self._result_path(job_id)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def cancel(self, job_id):
+        event = self._cancel_events.get(job_id)
+        future = self._futures.get(job_id)
+        if event is not None:
+            event.set()
+        if future is not None and future.cancel():
+            self._write_status(job_id, state="cancelled", message="Cancelled before it started")
+
+    def list_jobs(self, kind=None):
+        jobs = []
+        for name in os.listdir(self.job_dir):
+            if name.endswith(".json"):
+                status = self.status(name[:-5])
+                if status and (kind is None or status.get("kind") == kind):
+                    jobs.append(status)
+        return sorted(jobs, key=lambda job: job.get("created", 0), reverse=True)
+
+
+# --------- Time Budgets ---------
+def deadline_after(seconds):
+    """A time.monotonic() deadline `seconds` from now, or None when there is no budget."""
+    return time.monotonic() + seconds if seconds else None
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+def partial_notice(attrs):
+    """Warn when a results frame's `attrs` say the search didn't cover everything."""
+    if not attrs.get("incomplete"):
+        return
+    if attrs.get("skipped_pages") or attrs.get("skipped_details"):
+        st.warning(
+            f"⏱️ Stopped early: {attrs.get('skipped_pages', 0)} result page(s) and "
+            f"{attrs.get('skipped_details', 0)} advert detail page(s) were skipped."
+        )
+    if attrs.get("failed_details"):
+        st.warning(
+            f"⚠️ {attrs['failed_details']} advert detail page(s) failed to load and were left out; "
+            f"run the same search again to retry them."
+        )
+
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+
+# --------- Streamlit Panel ---------
+def job_panel(kind, session_key):
+    """
+    Show the background job attached to this session (or let the user attach
+    to any other job of `kind`) and return its results the first time it is
+    seen finished; later reruns return None so they don't replace whatever
+    the session has searched or uploaded since.
+    """
+    manager = get_job_manager()
+    jobs = manager.list_jobs(kind)
+
+    with st.expander("🗂️ Background searches", expanded=bool(st.session_state.get(session_key))):
+        if jobs:
+            # Nothing is attached until this session submits a job or the user picks one
+            options = {"— none —": None}
+            options.update({f"{job['id']} · {job['state']} · {job.get('label', '')}": job["id"] for job in jobs})
+            current = st.session_state.get(session_key)
+            labels = list(options)
+            index = next((i for i, label in enumerate(labels) if options[label] == current), 0)
+            st.session_state[session_key] = options[st.selectbox("Attach to search", labels, index=index)]
+        else:
+            st.caption("No background searches yet.")
+
+    job_id = st.session_state.get(session_key)
+    status = manager.status(job_id) if job_id else None
+    if not status:
+        return None
+
+    st.progress(status.get("progress", 0.0), text=f"Job `{job_id}` — {status['state']}: {status.get('message', '')}")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("🔄 Refresh status", key=f"{session_key}_refresh")
+    with col2:
+        if status["state"] in ACTIVE_STATES and st.button("⛔ Cancel search", key=f"{session_key}_cancel"):
+            manager.cancel(job_id)
+
+    adopted_key = f"{session_key}_adopted"
+    if status["state"] in ("done", "cancelled") and job_id not in st.session_state.get(adopted_key, ()):
+        st.session_state[adopted_key] = {*st.session_state.get(adopted_key, ()), job_id}
+        return manager.result(job_id)
+    return None
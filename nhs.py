@@ -4,20 +4,46 @@ import requests
 import re
 from bs4 import BeautifulSoup
 from datetime import datetime
-from fuzzywuzzy import fuzz
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import replace, asdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 import pandas as pd
-import io
+import os
+import itertools
 import gdrive_uploader
+from nhs_api import iter_search_pages, fetch_vacancy_page
+from enrichment import LazyDetails
+from job_filters import FilterSpec, compile_filters
+from records import JobRecord, JobColumns, NHS_COLUMNS
+from spill import SpillingColumns, read_results, count_rows, cluster_ids, remove_results
+from export import ResultExport, FORMAT_LABELS
+from jobs import get_job_manager, job_panel, deadline_after, expired, partial_notice
+from categories import band_label
+from query_planner import plan_queries, match_keywords, match_score
+from dedupe import assign_clusters, CLUSTER_COLUMN
+from reference_index import get_reference_index
+from checkpoint import Checkpoint, run_key
+from cost_estimate import (
+    CostEstimate, QueryEstimate, EXTRA_SAMPLE_PAGES, sample_pages, timed, rates, pages_for, detail_speed,
+    show_estimate
+)
+from pay_scales import infer_band_label
+from host_control import limited_get, mount_pool, record_levels, tripped_hosts, RequestSkipped, MAX_CONCURRENCY
+from detail_parser import parse_nhs_job_detail
+
+# Below this many detail pages the process pool start-up costs more than it saves
+PROCESS_PARSE_MIN_JOBS = 40
+
+# Detail-page fields an NHS Jobs advert needs, reusable from the reference index
+NHS_DETAIL_FIELDS = ("band", "sponsorship", "license")
 
 
 # --------- Utility Functions ---------
 def get_search_results_page(search_url, session):
     try:
-        response = session.get(search_url, timeout=10)
+        response = limited_get(session, search_url)
         if response.status_code == 200:
             return BeautifulSoup(response.text, "html.parser")
-    except:
+    except requests.RequestException:
         pass
     return None
 
@@ -42,166 +68,564 @@ def extract_numeric_salary(salary_str):
             return min(nums), max(nums)
     return None, None
 
-def extract_numeric_band(band_text):
-    match = re.search(r'\bBand\s*(\d+)', band_text, re.IGNORECASE)
-    return int(match.group(1)) if match else None
-
-def clean_date(date_str):
+def clean_date(date_str, iso=False):
+    """Parse a listing date: day-first text from the HTML pages, or ISO 8601 from the API with `iso`."""
     try:
+        if iso:
+            return pd.to_datetime(date_str, format="ISO8601").date()
         return pd.to_datetime(date_str, dayfirst=True).date()
-    except:
+    except (ValueError, TypeError):
         return None
 
-def job_passes_filters(title, job_info, salary, keyword):
-    if fuzz.partial_ratio(title.lower(), keyword.lower()) < 70:
-        return False
-    if salary and (not job_info["salary_num"] or job_info["salary_num"] < salary):
-        return False
-    return True
-
-def detect_sponsorship(soup):
-    denial_phrases = [
-        "not offer sponsorship", "no sponsorship", "unable to sponsor",
-        "not able to sponsor", "must have right to work",
-        "cannot provide visa", "cannot sponsor", "uk residency required"
-    ]
-    description_block = soup.get_text(separator=" ", strip=True).lower()
-    if any(phrase in description_block for phrase in denial_phrases):
-        return "Not Offered"
-    return "Likely Offered"
-
-def detect_drivers_license(soup):
-    license_phrases = [
-        "full uk driving licence", "uk driving license", "driver's license required",
-        "clean driving license", "must have driving licence", "access to a vehicle",
-        "own transport essential", "car driver essential", "you will need to drive"
-    ]
-    description_block = soup.get_text(separator=" ", strip=True).lower()
-    return any(phrase in description_block for phrase in license_phrases)
-
-def fetch_job_detail(full_link, session):
+# fetch_job_detail's result when the advert page couldn't be fetched; scrape_jobs
+# leaves those adverts unfinished in the checkpoint so a rerun retries them
+FETCH_FAILED = object()
+
+def fetch_job_detail(full_link, session, parse_pool=None, stopped=None):
+    """
+    Fetch an advert on an I/O thread and hand the raw bytes to `parse_pool` for parsing.
+    Returns FETCH_FAILED if the page can't be fetched, and raises RequestSkipped
+    rather than sending once `stopped()` is true.
+    """
     try:
-        response = session.get(full_link, timeout=10)
+        response = limited_get(session, full_link, stopped=stopped)
         response.raise_for_status()
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        band_tag = soup.select_one("#payscheme-band")
-        band_text = band_tag.get_text(strip=True) if band_tag else ""
-        band_num = extract_numeric_band(band_text)
+    except requests.RequestException:
+        # Includes HostUnavailable, so an open circuit costs no wait per advert
+        return FETCH_FAILED
+    if parse_pool is None:
+        return parse_nhs_job_detail(response.content)
+    return parse_pool.submit(parse_nhs_job_detail, response.content).result()
+
+def license_label(license_required):
+    return "Yes" if license_required else "No"
+
+def fetch_detail_fields(full_link, session):
+    index = get_reference_index()
+    cached = index.details(url=full_link, fields=NHS_DETAIL_FIELDS, source="nhs")
+    if cached is not None:
+        return {
+            "Band": cached["band"],
+            "Sponsorship": cached["sponsorship"],
+            "Driver's License Required": cached["license"],
+            "Reference Number": cached["reference"]
+        }
 
-        sponsorship = detect_sponsorship(soup)
-        license_required = detect_drivers_license(soup)
+    detail = fetch_job_detail(full_link, session)
+    if detail is FETCH_FAILED:
+        detail = (None, "Unknown", False, None)
+    band, sponsorship, license_required, ref_number = detail
+    if ref_number is not None:
+        index.record(ref_number, "nhs", full_link, band=band, sponsorship=sponsorship,
+                     license=license_label(license_required))
+    return {
+        "Band": band,
+        "Sponsorship": sponsorship,
+        "Driver's License Required": license_label(license_required),
+        "Reference Number": ref_number
+    }
+
+
+# --------- Listing Sources ---------
+# search_xml parameter names for the filters the HTML search URL also carries
+API_PARAM_NAMES = {
+    "keyword": "keyword",
+    "location": "location",
+    "distance": "distance",
+    "contractType": "contractType",
+    "workingPattern": "workingPattern",
+    "payBand": "payBand",
+    "min_salary": "salaryFrom",
+}
+
+def build_api_params(filters_cleaned):
+    params = {API_PARAM_NAMES[k]: v for k, v in filters_cleaned.items() if k in API_PARAM_NAMES}
+    params["sort"] = "publicationDateDesc"
+    return params
+
+def parse_html_listings(soup):
+    """JobRecords for the results on one search page."""
+    page_jobs = []
+    job_listings = soup.select("li[data-test='search-result']")
+    for job in job_listings:
+        try:
+            a_tag = job.select_one("h2 a[data-test='search-result-job-title']")
+            title = a_tag.get_text(strip=True) if a_tag else None
+            relative_link = a_tag['href'] if a_tag and 'href' in a_tag.attrs else None
+            full_link = f"https://www.jobs.nhs.uk{relative_link}" if relative_link else None
+
+            org_tag = job.select_one("div[data-test='search-result-location'] h3")
+            org_text = org_tag.get_text(separator="|", strip=True) if org_tag else ""
+            organisation, location = org_text.split("|", 1) if "|" in org_text else (org_text, org_text)
+
+            salary_tag = job.select_one("li[data-test='search-result-salary']")
+            salary_text = salary_tag.get_text(strip=True) if salary_tag else ""
+            min_salary, max_salary = extract_numeric_salary(salary_text)
+
+            date_posted_tag = job.select_one("li[data-test='search-result-publicationDate']")
+            date_posted_raw = date_posted_tag.get_text(strip=True).split(':')[-1] if date_posted_tag else None
+            date_posted = clean_date(date_posted_raw)
+
+            closing_date_tag = job.select_one("li[data-test='search-result-closingDate']")
+            closing_date_raw = closing_date_tag.get_text(strip=True).split(':')[-1] if closing_date_tag else None
+            closing_date = clean_date(closing_date_raw)
+
+            contract_tag = job.select_one("li[data-test='search-result-jobType']")
+            contract = contract_tag.get_text(strip=True).split(":")[-1].strip() if contract_tag else ""
+
+            pattern_tag = job.select_one("li[data-test='search-result-workingPattern']")
+            pattern = pattern_tag.get_text(strip=True).split(":")[-1].strip() if pattern_tag else ""
+
+            page_jobs.append(JobRecord(
+                title=title,
+                link=full_link,
+                organisation=organisation,
+                location=location,
+                min_salary=min_salary,
+                max_salary=max_salary,
+                contract_type=contract,
+                working_pattern=pattern,
+                date_posted=date_posted,
+                closing_date=closing_date,
+                source="nhs",
+            ))
+
+        except (AttributeError, KeyError, ValueError):
+            continue
+    return page_jobs
 
-        ref_tag = soup.select_one("#trac-job-reference")
-        ref_number = ref_tag.get_text(strip=True) if ref_tag else None
+def iter_html_listings(base_url, filters_cleaned, num_pages, session, start_page=1, on_page=None):
+    """Yield a JobRecord per search result; `on_page(page, jobs)` sees each parsed page first."""
+    for page in range(start_page, num_pages + 1):
+        filters_cleaned["page"] = page
+        search_url = base_url + urllib.parse.urlencode(filters_cleaned, quote_via=urllib.parse.quote)
+        soup = get_search_results_page(search_url, session)
+        if not soup:
+            continue
 
-        return band_num, sponsorship, license_required, ref_number
-    except:
-        return None, "Unknown", False, None
+        page_jobs = parse_html_listings(soup)
+        if on_page:
+            on_page(page, page_jobs)
+        yield from page_jobs
+
+def api_listings(vacancies, filters_cleaned):
+    """JobRecords for one search_xml page."""
+    # search_xml only returns adverts matching these, so the filter value is the advert's value
+    contract = filters_cleaned.get("contractType", "")
+    pattern = "Full time" if filters_cleaned.get("workingPattern") else ""
+
+    page_jobs = []
+    for vacancy in vacancies or []:
+        min_salary, max_salary = extract_numeric_salary(vacancy["salary"])
+        page_jobs.append(JobRecord(
+            title=vacancy["title"],
+            link=vacancy["url"],
+            organisation=vacancy["employer"],
+            location=", ".join(vacancy["locations"]),
+            min_salary=min_salary,
+            max_salary=max_salary,
+            contract_type=contract,
+            working_pattern=pattern,
+            date_posted=clean_date(vacancy["postDate"], iso=True),
+            closing_date=clean_date(vacancy["closeDate"], iso=True),
+            reference=vacancy["reference"] or None,
+            source="nhs",
+        ))
+    return page_jobs
+
+def iter_api_listings(filters_cleaned, num_pages, session, start_page=1, on_page=None):
+    pages = iter_search_pages(build_api_params(filters_cleaned), num_pages, session, start_page=start_page)
+    for page, status_code, vacancies in pages:
+        page_jobs = api_listings(vacancies, filters_cleaned)
+        # An error page isn't logged, so a resumed run asks for it again
+        if on_page and vacancies is not None:
+            on_page(page, page_jobs)
+        yield from page_jobs
 
 
 # --------- Main Scraper Logic ---------
-def scrape_jobs(base_url, filters_cleaned, num_pages):
-    results = []
-    jobs_to_process = []
-
-    session = requests.Session()
+NHS_SEARCH_URL = "https://www.jobs.nhs.uk/candidate/search/results?"
+
+# Fields an NHS Jobs listing row carries, and those the search query itself enforces
+NHS_LISTING_FIELDS = ("title", "min_salary", "contract_type", "working_pattern", "location")
+NHS_UPSTREAM_FIELDS = ("band", "contract_type", "working_pattern", "location")
+# search_xml isn't known to honour payBand, so the band is still checked locally
+NHS_API_UPSTREAM_FIELDS = ("contract_type", "working_pattern", "location")
+
+def nhs_pipeline(spec, source="api"):
+    upstream = NHS_API_UPSTREAM_FIELDS if source == "api" else NHS_UPSTREAM_FIELDS
+    return compile_filters(spec, NHS_LISTING_FIELDS, upstream)
+
+def unread_pages(source, num_pages, last_page=0):
+    """
+    Pages a stopped run never read. search_xml reports no total and ends at its
+    first empty page, so for the API only the next page is known to be due.
+    """
+    remaining = max(num_pages - last_page, 0)
+    return remaining if source == "html" else min(remaining, 1)
+
+def needs_detail_page(job, pipeline):
+    """Whether a detail check reads a field the listing row, with its inferred band, left empty."""
+    return job.band is None or any(getattr(job, check.field) is None for check in pipeline.detail_checks)
+
+def lazy_details_run(pipeline):
+    """Rows can skip their advert page (only the band is checked past the listing), so fill it in lazily."""
+    return all(check.field == "band" for check in pipeline.detail_checks)
+
+def detail_priority(job, keywords):
+    """
+    Sort key for detail fetches: soonest closing date first, then newest
+    posting, then best keyword match. Undated adverts go last.
+    """
+    closing = job.closing_date.toordinal() if job.closing_date else float("inf")
+    posted = job.date_posted.toordinal() if job.date_posted else 0
+    return closing, -posted, -match_score(job.title, keywords)
+
+def scrape_jobs(base_url, filters_cleaned, num_pages, spec, parse_workers=None, source="api", results=None,
+                progress=None, cancel_event=None, checkpoint=None, deadline=None):
+    """
+    Collect adverts from `source` ("api" for search_xml, "html" for the search pages)
+    into the `results` JobColumns, which is created if not given and returned.
+
+    The API already carries the reference number, so when `spec` has no
+    detail-only checks API rows skip the detail page entirely and come back
+    without band, sponsorship and licence fields. HTML rows always need it
+    for the reference.
+
+    `progress(fraction)` defaults to a Streamlit progress bar. Setting
+    `cancel_event`, or passing the time.monotonic() `deadline`, stops new
+    pages and detail fetches, lets in-flight fetches finish and keeps the
+    rows collected so far; what was skipped is counted on `results`.
+    Detail pages are fetched in detail_priority order, so a run cut short
+    has enriched the adverts closing soonest rather than the first listed.
+
+    With a `checkpoint`, listing pages and detail outcomes are logged as they
+    complete, and a rerun picks up from the first unlogged page and the jobs
+    still missing their detail page.
+    """
+    pipeline = nhs_pipeline(spec, source)
+    results = results if results is not None else JobColumns()
+    cancelled = cancel_event.is_set if cancel_event is not None else (lambda: False)
+    stopped = lambda: cancelled() or expired(deadline)
+
+    def attributed(jobs):
+        # One query can cover several keywords, so record which ones each advert matched
+        for job in jobs:
+            if pipeline.passes_listing(job):
+                job.matched_keywords = "; ".join(match_keywords(job.title, spec.keywords, spec.fuzzy_threshold))
+                if job.band is None:
+                    job.band = infer_band_label(job.min_salary, job.max_salary, job.date_posted)
+                yield job
+
+    session = mount_pool(requests.Session())
     session.headers.update({'User-Agent': 'Mozilla/5.0'})
 
-    for page in range(1, num_pages + 1):
-        filters_cleaned["page"] = page
-        search_url = base_url + urllib.parse.urlencode(filters_cleaned, quote_via=urllib.parse.quote)
-        soup = get_search_results_page(search_url, session)
-        if not soup:
+    start_page, resumed = 1, []
+    if checkpoint is not None:
+        start_page, resumed = checkpoint.next_page(), checkpoint.listed()
+        results.extend(checkpoint.kept())
+    last_page = start_page - 1
+    listed_all = False
+
+    def on_page(page, jobs):
+        nonlocal last_page
+        last_page = page
+        if checkpoint is not None:
+            checkpoint.complete_page(page, jobs)
+
+    def count_skipped_pages():
+        if not listed_all:
+            results.skipped_pages += unread_pages(source, num_pages, last_page)
+
+    def until_exhausted(jobs):
+        nonlocal listed_all
+        yield from jobs
+        listed_all = True
+
+    if source == "api":
+        listings = iter_api_listings(filters_cleaned, num_pages, session, start_page, on_page)
+    else:
+        listings = iter_html_listings(base_url, filters_cleaned, num_pages, session, start_page, on_page)
+    listings = until_exhausted(itertools.chain(resumed, listings))
+    listings = itertools.takewhile(lambda job: not stopped(), listings)
+
+    if source == "api" and not pipeline.needs_detail:
+        # Detail columns stay empty here; LazyDetails fills them for rows that get viewed or exported
+        results.extend(attributed(listings))
+        count_skipped_pages()
+        return results
+
+    index = get_reference_index()
+    jobs_to_process = []
+    for job in attributed(listings):
+        # Reuse detail fields either scraper already extracted for this advert
+        cached = index.details(job.reference, job.link, NHS_DETAIL_FIELDS, source="nhs")
+        if cached is None:
+            if needs_detail_page(job, pipeline):
+                jobs_to_process.append(job)
+            elif pipeline.passes_detail(job):
+                # The listing salary settles the band and no filter reads the page: skip the request
+                results.append(job)
             continue
+        job.band, job.sponsorship, job.license = cached["band"], cached["sponsorship"], cached["license"]
+        if pipeline.passes_detail(job):
+            results.append(job)
+    count_skipped_pages()
+    # The pool starts fetches in submission order, so sorting here makes it a priority queue
+    jobs_to_process.sort(key=lambda job: detail_priority(job, spec.keywords))
+    total_jobs = len(jobs_to_process)
+    if progress is None:
+        progress = st.progress(0).progress
+
+    parse_pool = None
+    if total_jobs >= PROCESS_PARSE_MIN_JOBS:
+        parse_pool = ProcessPoolExecutor(max_workers=parse_workers or os.cpu_count())
 
-        job_listings = soup.select("li[data-test='search-result']")
-        for job in job_listings:
-            try:
-                a_tag = job.select_one("h2 a[data-test='search-result-job-title']")
-                title = a_tag.get_text(strip=True) if a_tag else None
-                relative_link = a_tag['href'] if a_tag and 'href' in a_tag.attrs else None
-                full_link = f"https://www.jobs.nhs.uk{relative_link}" if relative_link else None
-
-                org_tag = job.select_one("div[data-test='search-result-location'] h3")
-                org_text = org_tag.get_text(separator="|", strip=True) if org_tag else ""
-                organisation, location = org_text.split("|", 1) if "|" in org_text else (org_text, org_text)
-
-                salary_tag = job.select_one("li[data-test='search-result-salary']")
-                salary_text = salary_tag.get_text(strip=True) if salary_tag else ""
-                min_salary, max_salary = extract_numeric_salary(salary_text)
-                salary_num = min_salary
-
-                date_posted_tag = job.select_one("li[data-test='search-result-publicationDate']")
-                date_posted_raw = date_posted_tag.get_text(strip=True).split(':')[-1] if date_posted_tag else None
-                date_posted = clean_date(date_posted_raw)
-
-                closing_date_tag = job.select_one("li[data-test='search-result-closingDate']")
-                closing_date_raw = closing_date_tag.get_text(strip=True).split(':')[-1] if closing_date_tag else None
-                closing_date = clean_date(closing_date_raw)
-
-                contract_tag = job.select_one("li[data-test='search-result-jobType']")
-                contract = contract_tag.get_text(strip=True).split(":")[-1].strip() if contract_tag else ""
-
-                pattern_tag = job.select_one("li[data-test='search-result-workingPattern']")
-                pattern = pattern_tag.get_text(strip=True).split(":")[-1].strip() if pattern_tag else ""
-
-                job_info = {
-                    "contract_type": contract,
-                    "location": location,
-                    "working_pattern": pattern,
-                    "salary_num": salary_num,
-                    "date posted": date_posted,
-                    "closing date": closing_date
-                }
-
-                if not job_passes_filters(title, job_info, filters_cleaned.get("min_salary", 0), filters_cleaned.get("keyword", "")):
+    try:
+        # Threads only bound the pool; the host's adaptive limit decides how many send at once
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+            future_to_job = {
+                executor.submit(fetch_job_detail, job.link, session, parse_pool, stopped): job
+                for job in jobs_to_process
+            }
+            jobs_to_process = None  # the futures map now owns the pending records
+
+            draining = False
+            for i, future in enumerate(as_completed(future_to_job)):
+                if stopped() and not draining:
+                    # Queued (lowest-priority) fetches are dropped; the ones already running finish and are kept
+                    results.skipped_details += sum(pending.cancel() for pending in future_to_job)
+                    draining = True
+                if future.cancelled():
                     continue
+                job = future_to_job.pop(future)
+                try:
+                    detail = future.result()
+                    if detail is FETCH_FAILED:
+                        results.failed_details += 1  # stays "listed" in the checkpoint for a rerun
+                        continue
+                    band, sponsorship, license_required, ref_number = detail
+
+                    job.band = band or job.band  # keep the band inferred from salary if the page has none
+                    job.sponsorship = sponsorship
+                    job.license = license_label(license_required)
+                    job.reference = job.reference or ref_number
+                    if ref_number is not None:
+                        index.record(ref_number, "nhs", job.link, band=band, sponsorship=sponsorship,
+                                     license=job.license, contract_type=job.contract_type,
+                                     working_pattern=job.working_pattern)
+                    kept = pipeline.passes_detail(job)
+                    if checkpoint is not None:
+                        checkpoint.finish_job(job, kept)
+                    if not kept:
+                        continue
+
+                    results.append(job)
+                except RequestSkipped:
+                    results.skipped_details += 1  # was waiting on the host's limit when the search stopped
+                except Exception:
+                    continue  # an advert page that doesn't parse is skipped; network failures were handled above
+                finally:
+                    progress((i + 1) / total_jobs)
+    finally:
+        # Also on errors and Streamlit reruns, so no parser processes outlive the run
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+    record_levels()
 
-                jobs_to_process.append({
-                    "Title": title,
-                    "Link": full_link,
-                    "Organisation": organisation,
-                    "Location": location,
-                    "Min Salary": min_salary,
-                    "Max Salary": max_salary,
-                    "Contract Type": contract,
-                    "Working Pattern": pattern,
-                    "Date Posted": date_posted,
-                    "Closing Date": closing_date,
-                })
-
-            except:
-                continue
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        future_to_job = {
-            executor.submit(fetch_job_detail, job['Link'], session): job for job in jobs_to_process
-        }
+    return results
 
-        progress_bar = st.progress(0)
-        for i, future in enumerate(as_completed(future_to_job)):
-            job = future_to_job[future]
-            try:
-                band, sponsorship, license_required, ref_number = future.result()
+def search_queries(base_url, filters_cleaned, num_pages, spec, plan, source="api", results=None,
+                   on_query=None, progress=None, cancel_event=None, deadline=None):
+    """
+    Run scrape_jobs once per planned query into one shared `results` and return it.
+
+    Progress is checkpointed under the search's filters, spec and plan, so the
+    same search started again after a crash, rerun or spent `deadline`
+    resumes; the checkpoint is cleared once every query has finished with
+    every advert page fetched.
+    """
+    results = results if results is not None else JobColumns()
+    spec = replace(spec, keywords=plan.keywords)
+    filters = {k: v for k, v in filters_cleaned.items() if k not in ("keyword", "page")}
+    checkpoint = Checkpoint(run_key("nhs", source, filters, num_pages, asdict(spec), [q.text for q in plan.queries]))
+    total = len(plan.queries)
+    for index, query in enumerate(plan.queries):
+        if (cancel_event is not None and cancel_event.is_set()) or expired(deadline):
+            results.skipped_pages += sum(unread_pages(source, q.pages(num_pages)) for q in plan.queries[index:])
+            return results
+        if on_query:
+            on_query(query)
+        filters_copy = filters_cleaned.copy()
+        filters_copy["keyword"] = query.text
+
+        if source == "html":
+            final_url = base_url + urllib.parse.urlencode(filters_copy, quote_via=urllib.parse.quote)
+            soup = get_search_results_page(final_url, requests.Session())
+            pages_to_scrape = min(query.pages(num_pages), get_total_pages(soup))
+        else:
+            pages_to_scrape = query.pages(num_pages)  # the API stops at the first empty page
+
+        query_progress = None
+        if progress is not None:
+            query_progress = lambda fraction, index=index, query=query: progress(
+                (index + fraction) / total, f"Query {index + 1}/{total}: {query.text}"
+            )
+        scrape_jobs(
+            base_url, filters_copy, pages_to_scrape, spec,
+            source=source, results=results, progress=query_progress, cancel_event=cancel_event,
+            checkpoint=checkpoint.scoped(query.text), deadline=deadline
+        )
+    if not (results.skipped_pages or results.skipped_details or results.failed_details):
+        checkpoint.clear()
+    return results
 
-                if filters_cleaned.get("license_filter", False) and license_required:
-                    continue
+def finalize_results(results):
+    df = results.to_frame(NHS_COLUMNS)
+    # Adverts whose detail page was skipped have no reference yet; their link identifies them
+    df = df[~df["Reference Number"].fillna(df["Link"]).duplicated()]
+    df = df.sort_values(by='Date Posted', ascending=False).reset_index(drop=True)
+    # Reference numbers only catch exact re-listings; clusters group re-posts of the same role
+    return assign_clusters(df)
+
+def run_search(params, progress, cancel_event):
+    """Background entry point for jobs.JobManager; `params` is built by main."""
+    spec = FilterSpec(**params["spec"])
+    plan = plan_queries(params["keywords"], "nhs", combine=params.get("combine", False))
+    results = search_queries(
+        NHS_SEARCH_URL, params["filters"], params["num_pages"], spec, plan,
+        source=params["source"], progress=progress, cancel_event=cancel_event,
+        deadline=deadline_after(params.get("time_budget"))
+    )
+    df = finalize_results(results)
+    # Tells the session that adopts the frame to resolve detail fields lazily
+    df.attrs["lazy_details"] = lazy_details_run(nhs_pipeline(spec, params["source"]))
+    return df
+
+# --------- Cost Estimate ---------
+def estimate_search(base_url, filters_cleaned, num_pages, spec, plan, source="api", extra_pages=EXTRA_SAMPLE_PAGES):
+    """
+    Dry run of search_queries: sample page 1 and `extra_pages` random pages
+    per query and project the run's adverts, detail fetches, requests and
+    duration. Page 1 of the search pages gives the advert total ("Page 1
+    of N") for either source, since search_xml doesn't report one.
+    """
+    spec = replace(spec, keywords=plan.keywords)
+    pipeline = nhs_pipeline(spec, source)
+    index = get_reference_index()
+    session = requests.Session()
+    session.headers.update({'User-Agent': 'Mozilla/5.0'})
 
-                job.update({
-                    "Band": band,
-                    "Sponsorship": sponsorship,
-                    "Driver's License Required": "Yes" if license_required else "No",
-                    "Reference Number": ref_number
-                })
+    def needs_fetch(job):
+        # The same decisions scrape_jobs makes before queueing a detail page
+        if not pipeline.passes_listing(job) or (source == "api" and not pipeline.needs_detail):
+            return False
+        job.band = job.band or infer_band_label(job.min_salary, job.max_salary, job.date_posted)
+        if index.details(job.reference, job.link, NHS_DETAIL_FIELDS, source="nhs") is not None:
+            return False
+        return needs_detail_page(job, pipeline)
+
+    def html_page(filters, page):
+        url = base_url + urllib.parse.urlencode({**filters, "page": page}, quote_via=urllib.parse.quote)
+        return get_search_results_page(url, session)
+
+    def sample(filters, page):
+        if source == "api":
+            (status_code, vacancies), seconds = timed(
+                fetch_vacancy_page, {**build_api_params(filters), "page": page}, session
+            )
+            jobs = api_listings(vacancies, filters)
+        else:
+            soup, seconds = timed(html_page, filters, page)
+            jobs = parse_html_listings(soup) if soup else []
+        return len(jobs), sum(needs_fetch(job) for job in jobs), seconds
+
+    estimate = CostEstimate("nhs")
+    for query in plan.queries:
+        filters = {k: v for k, v in filters_cleaned.items() if k != "page"}
+        filters["keyword"] = query.text
+
+        first_page, html_seconds = timed(html_page, filters, 1)
+        total_reported = first_page is not None
+        first_jobs = parse_html_listings(first_page) if total_reported else []
+        total = get_total_pages(first_page) * len(first_jobs)
+
+        if source == "html":
+            samples = [(len(first_jobs), sum(needs_fetch(job) for job in first_jobs), html_seconds)]
+        else:
+            samples = [sample(filters, 1)]
+        per_page = samples[0][0]
+        query_pages = query.pages(num_pages)
+        pages = pages_for(total, per_page, query_pages) if total_reported else query_pages
+        samples += [sample(filters, page) for page in sample_pages(pages, extra_pages)[1:]]
+
+        per_page, detail_share, page_seconds = rates(samples)
+        pages = pages_for(total, per_page, query_pages) if total_reported else query_pages
+        listings = min(total, pages * per_page) if total_reported else pages * per_page
+        estimate.queries.append(QueryEstimate(
+            query.text, pages, listings, listings * detail_share, page_seconds, total_reported
+        ))
+
+    estimate.detail_seconds, estimate.concurrency = detail_speed(base_url, fallback=estimate.mean_page_seconds())
+    return estimate
+
+# --------- Result Rendering ---------
+def discard_spilled_results():
+    """Forget the previous bounded-memory run and delete its files from disk."""
+    path = st.session_state.pop("nhs_results_path", None)
+    if path is not None:
+        remove_results(path)
+
+def use_lazy_details(enabled):
+    """Swap in a fresh LazyDetails (or none) for the session's current results."""
+    details = None
+    if enabled:
+        session = requests.Session()
+        session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        details = LazyDetails(lambda link: fetch_detail_fields(link, session))
+    if st.session_state.get("nhs_details") is not None:
+        st.session_state["nhs_details"].shutdown()
+    st.session_state["nhs_details"] = details
+    return details
+
+def show_spilled_results(all_results, details, keyword_count):
+    """Render a bounded-memory run: sorting, dedup and downloads all stream from the spill files."""
+    st.session_state.pop("df_sorted", None)
+    discard_spilled_results()
+
+    with st.spinner("Sorting and deduplicating results on disk..."):
+        results_path = all_results.write_parquet(os.path.join(all_results.spill_dir, "results.parquet"))
+        # Same rows in the same order as results.parquet, so its cluster IDs line up with the downloads
+        clusters = cluster_ids(results_path)
+        csv_path = all_results.write_csv("nhs_jobs_filtered.csv", NHS_COLUMNS, cluster_ids=clusters)
+        xlsx_path = all_results.write_excel(
+            os.path.join(all_results.spill_dir, "nhs_jobs_filtered.xlsx"), cluster_ids=clusters
+        )
+        all_results.cleanup()
+    # Kept, in the otherwise emptied spill directory, until an upload or the next search replaces it
+    st.session_state["nhs_results_path"] = results_path
 
+    st.subheader(f"Results ({count_rows(results_path)} unique jobs found across {keyword_count} keyword(s))")
+    preview = read_results(results_path, NHS_COLUMNS, limit=10)
+    st.dataframe(details.resolve(preview) if details else preview)
 
-                results.append(job)
-            except:
-                continue
-            progress_bar.progress((i + 1) / len(jobs_to_process))
+    with open(csv_path, "rb") as csv_file:
+        st.download_button(
+            label="📥 Download Results as CSV",
+            data=csv_file,
+            file_name="nhs_jobs_filtered.csv",
+            mime="text/csv"
+        )
+    with open(xlsx_path, "rb") as xlsx_file:
+        st.download_button(
+            label="📥 Download Results as Excel",
+            data=xlsx_file,
+            file_name="nhs_jobs_filtered.xlsx",
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        )
+    os.remove(xlsx_path)  # the download button holds its own copy of the bytes
 
-    return results
+    st.success("Saved to nhs_jobs_filtered.csv")
 
 # --------- Main UI App ---------
 def main():
@@ -231,6 +655,16 @@ def main():
 
         min_salary = st.number_input("Minimum Salary (£)", min_value=0, value=24000)
         num_pages = st.number_input("Pages to Scrape", min_value=1, max_value=500, value=1)
+        memory_budget = st.number_input(
+            "Spill results to disk above (MB, 0 = keep in memory)", min_value=0, value=0,
+            help="For very large runs: results are written to on-disk chunks, then sorted and "
+                 "deduplicated from there, and downloads stream from the files."
+        )
+        time_budget = st.number_input(
+            "Time budget (minutes, 0 = no limit)", min_value=0, value=0,
+            help="Stop starting new pages and detail fetches after this long and show what was found; "
+                 "running the same search again continues from where it stopped."
+        )
 
         location_filter = st.text_input("Location (optional)", "")
         distance = None
@@ -240,13 +674,41 @@ def main():
         sponsorship_required = st.checkbox("Only show jobs that offer visa sponsorship")
         license_filter = st.checkbox("Must Not Require Driver's License")
 
-        run_search = st.button("🔎 Search Jobs")
-
-    if not run_search:
-        st.info("Set your filters in the sidebar and click **Search Jobs**.")
+        source_label = st.radio("Listing Source", ["NHS Jobs API", "Search Pages"], index=0,
+                                help="The API returns reference numbers with the listing, so detail pages "
+                                     "are only fetched when a sponsorship or licence filter needs them.")
+        source = "api" if source_label == "NHS Jobs API" else "html"
+
+        combine_queries = st.checkbox("Combine keywords into fewer searches", value=False,
+                                      help="Keywords are OR-ed into shared queries and each result is matched "
+                                           "back to its keywords locally (see the Matched Keywords column). "
+                                           "Each keyword keeps its own page budget.")
+
+        export_format = FORMAT_LABELS[st.selectbox("Export Format", list(FORMAT_LABELS), index=0)]
+
+        background = st.checkbox("Run in background", help="Queue the search on the shared worker pool so it "
+                                 "keeps running if you navigate away; attach to it again from any session.")
+
+        search_clicked = st.button("🔎 Search Jobs")
+        estimate_clicked = st.button("📏 Estimate Cost", help="Sample a few result pages per keyword and project "
+                                     "the adverts, requests and time the search would take, without running it.")
+
+    finished = job_panel("nhs", "nhs_job_id")
+    if finished is not None and not search_clicked:
+        discard_spilled_results()
+        st.session_state["df_sorted"] = finished
+        details = use_lazy_details(finished.attrs.get("lazy_details", False))
+        st.subheader(f"Results ({len(finished)} unique jobs from background search)")
+        partial_notice(finished.attrs)
+        preview = finished.head(10)
+        st.dataframe(details.resolve(preview) if details else preview)
+        ResultExport(finished, "nhs_jobs_filtered").download_button(export_format)
+
+    if not (search_clicked or estimate_clicked):
+        if finished is None:
+            st.info("Set your filters in the sidebar and click **Search Jobs**.")
     else:
         band_range = bands[min_index:max_index + 1]
-        base_url = "https://www.jobs.nhs.uk/candidate/search/results?"
 
         filters = {
             "location": location_filter,
@@ -262,60 +724,84 @@ def main():
 
         filters_cleaned = {k: v for k, v in filters.items() if v != "" and v is not None}
 
-        all_results = []
-        status_placeholder = st.empty()
-
-        for keyword in keywords:
-            status_placeholder.info(f"🔍 Searching and filtering jobs for keyword: **{keyword}**...")
-            filters_copy = filters_cleaned.copy()
-            filters_copy["keyword"] = keyword
-
-            final_url = base_url + urllib.parse.urlencode(filters_copy, quote_via=urllib.parse.quote)
-            soup = get_search_results_page(final_url, requests.Session())
-
-            total_pages = get_total_pages(soup)
-            pages_to_scrape = min(num_pages, total_pages)
+        spec = FilterSpec(
+            min_salary=min_salary,
+            min_band=band_label(min_band),
+            max_band=band_label(max_band),
+            contract_type=filters_cleaned.get("contractType", ""),
+            working_pattern="Full time" if working_pattern != "Any" else "",
+            location=location_filter,
+            sponsorship="Offered" if sponsorship_required else None,
+            license="Does Not Require License" if license_filter else None
+        )
 
-            keyword_results = scrape_jobs(base_url, filters_copy, pages_to_scrape)
+        if estimate_clicked and not search_clicked:
+            plan = plan_queries(keywords, "nhs", combine=combine_queries)
+            with st.spinner("Sampling result pages..."):
+                estimate = estimate_search(NHS_SEARCH_URL, filters_cleaned, int(num_pages), spec, plan, source=source)
+            show_estimate(estimate, time_budget)
+            return
 
-            if sponsorship_required:
-                keyword_results = [job for job in keyword_results if job.get("Sponsorship") != "Not Offered"]
+        if background:
+            params = {
+                "filters": filters_cleaned, "spec": asdict(spec), "keywords": keywords,
+                "num_pages": int(num_pages), "source": source, "combine": combine_queries,
+                "time_budget": int(time_budget) * 60,
+            }
+            st.session_state["nhs_job_id"] = get_job_manager().submit("nhs", params, label=", ".join(keywords))
+            st.rerun()
 
-            all_results.extend(keyword_results)
+        all_results = SpillingColumns(memory_budget_mb=memory_budget) if memory_budget else JobColumns()
+        status_placeholder = st.empty()
+        # Rows that skipped their detail page (API listings, or bands inferred from salary) fill it in lazily
+        lazy_details = lazy_details_run(nhs_pipeline(spec, source))
+
+        plan = plan_queries(keywords, "nhs", combine=combine_queries)
+        st.caption(f"🧭 {plan.summary(int(num_pages))}")
+
+        search_queries(
+            NHS_SEARCH_URL, filters_cleaned, num_pages, spec, plan, source=source, results=all_results,
+            on_query=lambda query: status_placeholder.info(
+                f"🔍 Searching and filtering jobs for: **{query.text}**..."
+            ),
+            deadline=deadline_after(time_budget * 60)
+        )
 
         status_placeholder.empty()
+        if tripped_hosts():
+            st.warning(f"⚡ Requests to {', '.join(tripped_hosts())} were failing, so some were skipped "
+                       f"rather than waited on; results from those sites may be incomplete.")
+        partial_notice(all_results.partial_attrs())
 
-        if not all_results:
+        if not len(all_results):
             st.warning("No jobs found for the provided keyword(s) and filters.")
             return
 
-        df = pd.DataFrame(all_results).drop_duplicates(subset=["Reference Number"])
-        df_sorted = df.sort_values(by='Date Posted', ascending=False).reset_index(drop=True)
+        details = use_lazy_details(lazy_details)
 
-        st.session_state["df_sorted"] = df_sorted
+        if memory_budget:
+            show_spilled_results(all_results, details, len(keywords))
+        else:
+            discard_spilled_results()
+            df_sorted = finalize_results(all_results)
 
-        st.subheader(f"Results ({len(df_sorted)} unique jobs found across {len(keywords)} keyword(s))")
-        st.dataframe(df_sorted.head(10))
+            st.session_state["df_sorted"] = df_sorted
 
-        df_sorted.to_csv("nhs_jobs_filtered.csv", index=False)
+            st.subheader(f"Results ({len(df_sorted)} unique jobs found across {len(keywords)} keyword(s))")
+            st.caption(f"{df_sorted[CLUSTER_COLUMN].nunique()} distinct roles after grouping near-duplicate "
+                       f"adverts — rows sharing a Cluster ID are the same role.")
+            preview = df_sorted.head(10)
+            st.dataframe(details.resolve(preview) if details else preview)
 
-        csv_buffer = io.StringIO()
-        df_sorted.to_csv(csv_buffer, index=False)
-        csv_data = csv_buffer.getvalue()
+            # Serialized once: the saved file and the download share the same bytes
+            export = ResultExport(df_sorted, "nhs_jobs_filtered")
+            saved_path = export.save(export_format)
+            export.download_button(export_format)
 
-        st.download_button(
-            label="📥 Download Results as CSV",
-            data=csv_data,
-            file_name="nhs_jobs_filtered.csv",
-            mime="text/csv"
-        )
-
-        st.success("Saved to nhs_jobs_filtered.csv")
+            st.success(f"Saved to {os.path.basename(saved_path)}")
 
-   
 
-
-    if "df_sorted" in st.session_state:
+    if "df_sorted" in st.session_state or "nhs_results_path" in st.session_state:
          # Upload section – outside the scraping logic, always available if session data exists
         st.markdown("---")
         st.subheader("📤 Upload to Google Drive")
@@ -328,11 +814,28 @@ def main():
             "Tech"
         ], index=None, placeholder="Choose a category")
 
+        details = st.session_state.get("nhs_details")
+        if details is not None and "df_sorted" in st.session_state:
+            st.caption("Band, sponsorship and licence are fetched only for rows you view, export or upload.")
+            if st.button("📥 Export with detail fields"):
+                with st.spinner(f"Fetching detail pages for {len(st.session_state['df_sorted'])} job(s)..."):
+                    st.session_state["df_sorted"] = details.resolve(st.session_state["df_sorted"])
+                ResultExport(st.session_state["df_sorted"], "nhs_jobs_filtered").download_button(
+                    "csv", label="📥 Download Full Results as CSV"
+                )
+
         if not category:
             st.error("Please select a category before upload")
         if st.button("📤 Upload"):
             try:
                 import gdrive_uploader
+                if "df_sorted" not in st.session_state:
+                    # Bounded-memory runs keep their results on disk until an upload needs them
+                    st.session_state["df_sorted"] = assign_clusters(
+                        read_results(st.session_state["nhs_results_path"], NHS_COLUMNS)
+                    )
+                if details is not None:
+                    st.session_state["df_sorted"] = details.resolve(st.session_state["df_sorted"])
                 message = gdrive_uploader.upload_to_drive(st.session_state["df_sorted"], category, prefix = "nhs")
                 st.success("✅ Upload completed successfully!")
                 st.caption(message)
@@ -0,0 +1,110 @@
+import requests
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+
+SEARCH_XML_URL = "https://www.jobs.nhs.uk/api/v1/search_xml"
+
+VACANCY_FIELDS = (
+    "title", "employer", "description", "salary",
+    "closeDate", "postDate", "reference", "url"
+)
+
+
+# --------- Streaming XML Parsing ---------
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def iter_vacancies(stream):
+    """
+    Yield one plain dict per <vacancyDetails> element as it is read from `stream`.
+
+    Each vacancy element is detached from its parent once yielded, so memory
+    stays flat no matter how large the response is.
+    """
+    parents = []
+    record = None
+
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        name = _local_name(elem.tag)
+
+        if event == "start":
+            parents.append(elem)
+            if name == "vacancyDetails":
+                record = dict.fromkeys(VACANCY_FIELDS, "")
+                record["locations"] = []
+            continue
+
+        parents.pop()
+        if record is None:
+            continue
+
+        if name == "vacancyDetails":
+            yield record
+            record = None
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
+        elif name == "locations":
+            record["locations"].append("".join(elem.itertext()).strip())
+        elif name in VACANCY_FIELDS and not record[name]:
+            record[name] = "".join(elem.itertext()).strip()
+
+def vacancy_to_row(record):
+    return {
+        "Title": record["title"],
+        "Employer": record["employer"],
+        "Description": record["description"],
+        "Location(s)": ", ".join(record["locations"]),
+        "Salary": record["salary"],
+        "Closing Date": record["closeDate"],
+        "Post Date": record["postDate"],
+        "Reference": record["reference"],
+        "URL": record["url"]
+    }
+
+
+# --------- Paged Fetching ---------
+def fetch_vacancy_page(params, session=None):
+    """
+    Return (status_code, records) for one search_xml page, parsed straight off
+    the socket. A page that times out, drops or arrives truncated comes back
+    as (None, None).
+    """
+    http = session or requests
+    try:
+        response = http.get(SEARCH_XML_URL, params=params, stream=True, timeout=30)
+    except requests.RequestException:
+        return None, None
+    try:
+        if response.status_code != 200:
+            return response.status_code, None
+        response.raw.decode_content = True
+        return response.status_code, list(iter_vacancies(response.raw))
+    except (requests.RequestException, ET.ParseError):
+        return None, None
+    finally:
+        response.close()
+
+def iter_search_pages(params, max_pages, session=None, start_page=1):
+    """
+    Yield (page, status_code, records) for each search_xml page.
+
+    The next page is fetched and parsed in the background while the caller
+    works through the current one. Iteration stops after an error status or
+    the first empty page, which are still yielded so callers can report them;
+    a page that failed to arrive is yielded as (page, None, None) and skipped.
+    """
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        future = prefetcher.submit(fetch_vacancy_page, {**params, "page": start_page}, session)
+
+        for page in range(start_page, max_pages + 1):
+            status_code, records = future.result()
+            failed = status_code is None
+            if (records or failed) and page < max_pages:
+                future = prefetcher.submit(fetch_vacancy_page, {**params, "page": page + 1}, session)
+
+            yield page, status_code, records
+
+            if not (records or failed):
+                break
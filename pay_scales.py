@@ -0,0 +1,109 @@
+import datetime
+import pandas as pd
+
+
+# Agenda for Change annual pay ranges (England), bottom and top of each band.
+# A pay year runs from 1 April; add the next year's table here when it is published.
+AFC_PAY_SCALES = {
+    "2024/25": {
+        "2": (23_615, 23_615),
+        "3": (24_071, 25_674),
+        "4": (26_530, 29_114),
+        "5": (29_970, 36_483),
+        "6": (37_338, 44_962),
+        "7": (46_148, 52_809),
+        "8a": (53_755, 60_504),
+        "8b": (62_215, 72_293),
+        "8c": (74_290, 85_601),
+        "8d": (88_168, 101_677),
+        "9": (105_385, 121_271),
+    },
+    "2025/26": {
+        "2": (24_465, 24_465),
+        "3": (24_937, 26_598),
+        "4": (27_485, 30_162),
+        "5": (31_049, 37_796),
+        "6": (38_682, 46_580),
+        "7": (47_810, 54_710),
+        "8a": (55_690, 62_682),
+        "8b": (64_455, 74_896),
+        "8c": (76_965, 88_682),
+        "8d": (91_342, 105_337),
+        "9": (109_179, 125_637),
+    },
+}
+
+LATEST_PAY_YEAR = max(AFC_PAY_SCALES)
+
+# Below this, the listing salary doesn't settle the band and the detail page is still fetched
+BAND_CONFIDENCE = 0.9
+
+
+def pay_year(on=None):
+    """The pay-year label in force on date `on`, falling back to the nearest table we have."""
+    on = on or datetime.date.today()
+    start = on.year if on.month >= 4 else on.year - 1
+    label = f"{start}/{str(start + 1)[-2:]}"
+    if label in AFC_PAY_SCALES:
+        return label
+    return LATEST_PAY_YEAR if label > LATEST_PAY_YEAR else min(AFC_PAY_SCALES)
+
+def band_label(label):
+    """Result label for a pay-scale key, matching categories.BAND_LEVELS."""
+    return f"Band {label}"
+
+
+# --------- Interval Index ---------
+_indexes = {}
+
+def band_index(year):
+    """IntervalIndex over the year's band ranges, labelled by band."""
+    if year not in _indexes:
+        scale = AFC_PAY_SCALES[year]
+        _indexes[year] = (pd.IntervalIndex.from_tuples(list(scale.values()), closed="both"), list(scale))
+    return _indexes[year]
+
+def _match(low, high, year):
+    intervals, labels = band_index(year)
+    if low == high:
+        position = intervals.get_indexer([low])[0]
+        return (labels[position], 1.0) if position >= 0 else (None, 0.0)
+
+    best, best_share = None, 0.0
+    for position in intervals.overlaps(pd.Interval(low, high, closed="both")).nonzero()[0]:
+        interval = intervals[position]
+        share = float(min(high, interval.right) - max(low, interval.left)) / (high - low)
+        if share > best_share:
+            best, best_share = labels[position], share
+    return best, round(best_share, 3)
+
+def infer_band(min_salary, max_salary=None, on=None):
+    """
+    Best-matching band label for a listing's salary range, with a confidence
+    in [0, 1]: the share of the advertised range that falls inside that band
+    (1.0 when the whole range sits in one band). `(None, 0.0)` when no band
+    overlaps, as for hourly or non-AfC pay.
+
+    Adverts early in a pay year often still quote last year's scale, so the
+    previous table is tried too and the better match wins. When the two years
+    place the salary in different bands there's no telling which scale the
+    advert used, so the confidence is halved to leave it to the advert page.
+    """
+    if not min_salary or pd.isna(min_salary):
+        return None, 0.0
+    if not max_salary or pd.isna(max_salary):
+        max_salary = min_salary
+    low, high = min(min_salary, max_salary), max(min_salary, max_salary)
+
+    years = sorted(AFC_PAY_SCALES)
+    current = years.index(pay_year(on))
+    matches = [_match(low, high, year) for year in years[current::-1][:2]]
+    best = max(matches, key=lambda match: match[1])
+    if len({label for label, _ in matches if label is not None}) > 1:
+        return best[0], round(best[1] / 2, 3)
+    return best
+
+def infer_band_label(min_salary, max_salary=None, on=None, min_confidence=BAND_CONFIDENCE):
+    """Band label ("Band 8a") when the salary settles it with at least `min_confidence`, else None."""
+    label, confidence = infer_band(min_salary, max_salary, on)
+    return band_label(label) if label is not None and confidence >= min_confidence else None
@@ -0,0 +1,92 @@
+from dataclasses import dataclass, field
+from rapidfuzz.fuzz import partial_ratio
+
+
+# Per-source query syntax: how keywords are OR-ed together and how many fit in one query.
+# Neither site documents OR in its keyword search, so combining stays opt-in.
+QUERY_SYNTAX = {
+    "nhs": {"or": " OR ", "max_terms": 5},
+    "trac": {"or": " OR ", "max_terms": 5},
+}
+
+
+@dataclass
+class Query:
+    text: str
+    keywords: list
+    terms: int = 1   # search terms OR-ed into `text`
+
+    def pages(self, pages_per_keyword):
+        """Page budget for this query: every search term keeps its own `pages_per_keyword`."""
+        return self.terms * pages_per_keyword
+
+
+@dataclass
+class QueryPlan:
+    keywords: list
+    queries: list = field(default_factory=list)
+
+    def naive_requests(self, pages_per_keyword):
+        return len(self.keywords) * pages_per_keyword
+
+    def planned_requests(self, pages_per_keyword):
+        return sum(query.pages(pages_per_keyword) for query in self.queries)
+
+    def summary(self, pages_per_keyword):
+        planned = self.planned_requests(pages_per_keyword)
+        naive = self.naive_requests(pages_per_keyword)
+        return (f"{len(self.queries)} combined quer{'y' if len(self.queries) == 1 else 'ies'} for "
+                f"{len(self.keywords)} keyword(s): up to {planned} search-page requests instead of {naive}")
+
+
+# --------- Planning ---------
+def _covers(broad, narrow):
+    """A keyword-search for `broad` already returns everything `narrow` would."""
+    return set(broad.lower().split()) <= set(narrow.lower().split())
+
+def _quote(keyword):
+    return f'"{keyword}"' if " " in keyword else keyword
+
+def plan_queries(keywords, source="nhs", combine=False):
+    """
+    Merge `keywords` into the fewest upstream queries.
+
+    A keyword whose words all appear in another keyword is dropped from the
+    query list since the broader term already returns its adverts; with
+    `combine`, what is left is OR-ed together in groups of the source's
+    `max_terms`. Every original keyword stays in `plan.keywords` for local
+    attribution.
+    """
+    keywords = list(dict.fromkeys(k.strip() for k in keywords if k.strip()))
+    syntax = QUERY_SYNTAX[source]
+
+    broad_terms = []
+    for keyword in sorted(keywords, key=lambda k: len(k.split())):
+        if not any(_covers(term, keyword) for term in broad_terms):
+            broad_terms.append(keyword)
+
+    covered_by = {term: [k for k in keywords if _covers(term, k)] for term in broad_terms}
+
+    group_size = syntax["max_terms"] if combine else 1
+    plan = QueryPlan(keywords=keywords)
+    for i in range(0, len(broad_terms), group_size):
+        group = broad_terms[i:i + group_size]
+        text = group[0] if len(group) == 1 else syntax["or"].join(_quote(term) for term in group)
+        plan.queries.append(Query(text, [k for term in group for k in covered_by[term]], len(group)))
+    return plan
+
+
+# --------- Local Attribution ---------
+def match_keywords(title, keywords, threshold=70):
+    """The keywords a title matches under the same fuzzy score the keyword filter uses."""
+    if not title:
+        return []
+    title = title.lower()
+    return [kw for kw in keywords if partial_ratio(title, kw.lower()) >= threshold]
+
+def match_score(title, keywords):
+    """Best fuzzy score (0-100) of `title` against any of `keywords`."""
+    if not title or not keywords:
+        return 0
+    title = title.lower()
+    return max(partial_ratio(title, kw.lower()) for kw in keywords)
@@ -0,0 +1,156 @@
+from dataclasses import dataclass, fields
+import pandas as pd
+
+from categories import categorize
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is optional; columns then stay as plain lists
+    pa = None
+
+
+# --------- Job Record ---------
+@dataclass(slots=True)
+class JobRecord:
+    """One advert as plain extracted values — never holds a parsed page or Tag."""
+    title: str = ""
+    link: str = ""
+    organisation: str = ""
+    location: str = ""
+    min_salary: int = None
+    max_salary: int = None
+    contract_type: str = ""
+    working_pattern: str = ""
+    date_posted: object = None
+    closing_date: object = None
+    band: str = None            # canonical label, e.g. "Band 8a"
+    sponsorship: str = None
+    license: str = None
+    reference: str = None
+    source: str = ""
+    matched_keywords: str = None
+
+
+RECORD_FIELDS = tuple(f.name for f in fields(JobRecord))
+
+if pa is not None:
+    RECORD_TYPES = {
+        "title": pa.string(),
+        "link": pa.string(),
+        "organisation": pa.string(),
+        "location": pa.string(),
+        "min_salary": pa.int64(),
+        "max_salary": pa.int64(),
+        "contract_type": pa.string(),
+        "working_pattern": pa.string(),
+        "date_posted": pa.date32(),
+        "closing_date": pa.date32(),
+        "band": pa.string(),
+        "sponsorship": pa.string(),
+        "license": pa.string(),
+        "reference": pa.string(),
+        "source": pa.string(),
+        "matched_keywords": pa.string(),
+    }
+
+# Output column labels per source, in display order
+NHS_COLUMNS = {
+    "title": "Title",
+    "link": "Link",
+    "organisation": "Organisation",
+    "location": "Location",
+    "min_salary": "Min Salary",
+    "max_salary": "Max Salary",
+    "contract_type": "Contract Type",
+    "working_pattern": "Working Pattern",
+    "date_posted": "Date Posted",
+    "closing_date": "Closing Date",
+    "band": "Band",
+    "sponsorship": "Sponsorship",
+    "license": "Driver's License Required",
+    "reference": "Reference Number",
+    "matched_keywords": "Matched Keywords",
+}
+
+TRAC_COLUMNS = {
+    "title": "Title",
+    "organisation": "Employer",
+    "band": "Band",
+    "min_salary": "Min Salary",
+    "max_salary": "Max Salary",
+    "link": "URL",
+    "sponsorship": "Sponsorship Status",
+    "license": "License Requirement",
+    "reference": "Reference Number",
+    "matched_keywords": "Matched Keywords",
+}
+
+
+# --------- Columnar Accumulation ---------
+class JobColumns:
+    """
+    Accumulate JobRecords column by column.
+
+    Rows are buffered in small per-column lists and sealed into typed Arrow
+    arrays every `chunk_size` rows, so a large run holds compact columns
+    rather than one dict per advert. `to_frame` wraps those arrays in an
+    Arrow-backed DataFrame without copying them.
+
+    Scrapers that stop early (cancelled, or out of time) add to
+    `skipped_pages` and `skipped_details`, and detail pages that fail to load
+    add to `failed_details`; `to_frame` reports them in `df.attrs` along with
+    an `incomplete` flag.
+    """
+
+    def __init__(self, chunk_size=4096):
+        self.chunk_size = chunk_size
+        self._pending = {name: [] for name in RECORD_FIELDS}
+        self._chunks = {name: [] for name in RECORD_FIELDS}
+        self._length = 0
+        self.skipped_pages = 0
+        self.skipped_details = 0
+        self.failed_details = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, record):
+        for name, column in self._pending.items():
+            column.append(getattr(record, name))
+        self._length += 1
+        if len(self._pending["title"]) >= self.chunk_size:
+            self._seal()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def _seal(self):
+        if pa is None or not self._pending["title"]:
+            return
+        for name, column in self._pending.items():
+            self._chunks[name].append(pa.array(column, type=RECORD_TYPES[name]))
+            self._pending[name] = []
+
+    def column(self, name):
+        self._seal()
+        if pa is None:
+            return self._pending[name]
+        return pa.chunked_array(self._chunks[name], type=RECORD_TYPES[name])
+
+    def partial_attrs(self):
+        return {
+            "incomplete": bool(self.skipped_pages or self.skipped_details or self.failed_details),
+            "skipped_pages": self.skipped_pages,
+            "skipped_details": self.skipped_details,
+            "failed_details": self.failed_details,
+        }
+
+    def to_frame(self, columns=NHS_COLUMNS):
+        if pa is None:
+            df = categorize(pd.DataFrame({label: self._pending[name] for name, label in columns.items()}))
+        else:
+            table = pa.table({label: self.column(name) for name, label in columns.items()})
+            df = categorize(table.to_pandas(types_mapper=pd.ArrowDtype))
+        df.attrs.update(self.partial_attrs())
+        return df
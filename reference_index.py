@@ -0,0 +1,173 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import pandas as pd
+
+from records import NHS_COLUMNS, TRAC_COLUMNS
+
+
+REFERENCE_INDEX_PATH = os.environ.get(
+    "REFERENCE_INDEX_PATH", os.path.join(tempfile.gettempdir(), "job_references.sqlite")
+)
+
+# Detail fields older than this are fetched again rather than reused
+MAX_DETAIL_AGE = 7 * 24 * 3600
+
+DETAIL_FIELDS = ("band", "sponsorship", "license", "contract_type", "working_pattern")
+
+# Sponsorship and licence are stored in FilterSpec's vocabulary so either
+# scraper can reuse the other's; these are each source's own labels for the
+# stored values, where they differ (a label shared by several values stores as the first)
+SOURCE_LABELS = {
+    "nhs": {
+        "sponsorship": {"Offered": "Likely Offered"},
+        "license": {"Possibly Not Required": "No", "Does Not Require License": "No", "Requires License": "Yes"},
+    },
+}
+
+def _stored_value(source, field, label):
+    for value, source_label in SOURCE_LABELS.get(source, {}).get(field, {}).items():
+        if source_label == label:
+            return value
+    return label
+
+def _source_label(source, field, value):
+    return SOURCE_LABELS.get(source, {}).get(field, {}).get(value, value)
+
+# Trac references look like C9123-25-0456 (employer code, year, sequence)
+TRAC_REFERENCE_PATTERN = r"\b[A-Z0-9]{4,6}-\d{2}-\d{3,6}\b"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS adverts (
+    reference TEXT PRIMARY KEY,
+    nhs_url TEXT,
+    trac_url TEXT,
+    band TEXT,
+    sponsorship TEXT,
+    license TEXT,
+    contract_type TEXT,
+    working_pattern TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS adverts_nhs_url ON adverts (nhs_url);
+CREATE INDEX IF NOT EXISTS adverts_trac_url ON adverts (trac_url);
+"""
+
+
+# --------- Persistent Index ---------
+class ReferenceIndex:
+    """
+    Trac reference number -> the advert's NHS Jobs URL, its HealthJobsUK URL
+    and whichever detail fields either scraper has already extracted.
+    """
+
+    def __init__(self, path=REFERENCE_INDEX_PATH, max_age=MAX_DETAIL_AGE):
+        self.max_age = max_age
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def record(self, reference, source, url, **details):
+        """Link `url` (from `source`, "nhs" or "trac") to `reference` and store any non-empty details."""
+        if not reference:
+            return
+        url_column = "nhs_url" if source == "nhs" else "trac_url"
+        details = {
+            k: _stored_value(source, k, v) for k, v in details.items()
+            if k in DETAIL_FIELDS and v not in (None, "")
+        }
+        columns = ["reference", url_column, *details, "updated"]
+        values = [reference, url, *details.values(), time.time()]
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns[1:])
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO adverts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(reference) DO UPDATE SET {updates}",
+                values
+            )
+
+    def _fresh(self, row):
+        if row is None or row["updated"] < time.time() - self.max_age:
+            return None
+        return dict(row)
+
+    def lookup(self, reference=None, url=None):
+        """The indexed advert for `reference`, or for a URL from either source, if recent enough."""
+        with self._lock:
+            if reference:
+                row = self._conn.execute("SELECT * FROM adverts WHERE reference = ?", (reference,)).fetchone()
+                if row is not None:
+                    return self._fresh(row)
+            if url:
+                row = self._conn.execute(
+                    "SELECT * FROM adverts WHERE nhs_url = ? OR trac_url = ? ORDER BY updated DESC LIMIT 1",
+                    (url, url)
+                ).fetchone()
+                return self._fresh(row)
+        return None
+
+    def details(self, reference=None, url=None, fields=DETAIL_FIELDS, required=None, source=None):
+        """
+        Stored `fields` and the advert's reference, only when every one of
+        `required` (all of `fields` by default) is present. Labels come back
+        in `source`'s own vocabulary when it's given.
+        """
+        row = self.lookup(reference, url)
+        required = fields if required is None else required
+        if row is None or any(row[f] is None for f in required):
+            return None
+        details = {f: _source_label(source, f, row[f]) for f in fields}
+        details["reference"] = row["reference"]
+        return details
+
+    def close(self):
+        self._conn.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_reference_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ReferenceIndex()
+        return _index
+
+
+# --------- Cross-Source Merge ---------
+# Trac labels renamed to their NHS equivalents so both frames share columns
+TRAC_TO_NHS_LABELS = {TRAC_COLUMNS[name]: NHS_COLUMNS[name] for name in TRAC_COLUMNS if name in NHS_COLUMNS}
+
+def merge_sources(nhs_df, trac_df, key="Reference Number"):
+    """
+    Combine NHS and Trac results into one frame with one row per reference.
+
+    Rows sharing a reference collapse in a single hash-grouping pass, taking
+    each column's first non-empty value (NHS first) and listing both sources;
+    rows without a reference are kept as they are.
+    """
+    frames = []
+    if nhs_df is not None and not nhs_df.empty:
+        frames.append(nhs_df.assign(Source="nhs"))
+    if trac_df is not None and not trac_df.empty:
+        frames.append(trac_df.rename(columns=TRAC_TO_NHS_LABELS).assign(Source="trac"))
+    if not frames:
+        return pd.DataFrame(columns=list(NHS_COLUMNS.values()) + ["Source"])
+
+    combined = pd.concat(frames, ignore_index=True)
+    if key not in combined.columns:
+        return combined
+
+    has_key = combined[key].notna()
+    keyed = combined[has_key]
+    aggregations = {column: "first" for column in keyed.columns if column not in (key, "Source")}
+    aggregations["Source"] = lambda sources: ", ".join(dict.fromkeys(sources))
+    merged = keyed.groupby(key, sort=False, as_index=False).agg(aggregations)
+
+    return pd.concat([merged[combined.columns], combined[~has_key]], ignore_index=True)
@@ -5,54 +5,38 @@ import pandas as pd
 import numpy as np
 import re
 from datetime import datetime
+from nhs_api import iter_search_pages, vacancy_to_row
+from pay_scales import infer_band_label
+from categories import BAND_DTYPE, band_label, band_mask
+from host_control import limited_get
 
 # === Fetch Jobs from NHS API ===
 def fetch_nhs_jobs(keyword="visa sponsorship", max_pages=100):
-    base_url = "https://www.jobs.nhs.uk/api/v1/search_xml"
     job_records = []
-    page = 1
-
-    while page <= max_pages:
-        params = {
-            "keyword": keyword,
-            "page": page,
-            "sort": "publicationDateDesc",
-            "contractType": "Permanent",
-            "salaryFrom": 24000,
-        }
-
-        response = requests.get(base_url, params=params)
-        if response.status_code != 200:
-            print(f"Error on page {page}: {response.status_code}")
+    params = {
+        "keyword": keyword,
+        "sort": "publicationDateDesc",
+        "contractType": "Permanent",
+        "salaryFrom": 24000,
+    }
+
+    for page, status_code, vacancy_list in iter_search_pages(params, max_pages):
+        if vacancy_list is None:
+            print(f"Error on page {page}: {status_code}")
             break
 
-        soup = BeautifulSoup(response.content, "xml")
-        vacancy_list = soup.find_all("vacancyDetails")
-
         if not vacancy_list:
             break
 
         for job in vacancy_list:
-            title_text = job.title.text if job.title else ""
-            similarity = fuzz.token_set_ratio(keyword.lower(), title_text.lower())
+            similarity = fuzz.token_set_ratio(keyword.lower(), job["title"].lower())
 
             if similarity < 80:
                 continue  # Skip low-similarity titles
 
-            job_records.append({
-                "Title": title_text,
-                "Employer": job.employer.text if job.employer else "",
-                "Description": job.description.text if job.description else "",
-                "Location(s)": ", ".join([loc.text for loc in job.find_all("locations")]),
-                "Salary": job.salary.text if job.salary else "",
-                "Closing Date": job.closeDate.text if job.closeDate else "",
-                "Post Date": job.postDate.text if job.postDate else "",
-                "Reference": job.reference.text if job.reference else "",
-                "URL": job.url.text if job.url else ""
-            })
+            job_records.append(vacancy_to_row(job))
 
         print(f"Page {page} processed. Jobs collected so far: {len(job_records)}")
-        page += 1
 
     return pd.DataFrame(job_records)
 
@@ -85,31 +69,34 @@ def process_dates(df):
 # === Get Pay Band from Job URL ===
 def get_pay_band(url):
     try:
-        response = requests.get(url, timeout=10)
+        response = limited_get(requests, url)
         if response.status_code == 200:
             soup = BeautifulSoup(response.text, "html.parser")
             pay_band_element = soup.select_one("#payscheme-band")
             if pay_band_element:
                 return pay_band_element.get_text(strip=True)
-    except:
+    except requests.RequestException:
         pass
     return "Not found"
 
 # === Enrich DataFrame with Pay Band ===
 def enrich_with_pay_band(df):
-    print("Fetching pay bands (this may take a few minutes)...")
-    df['Pay Band'] = df['URL'].apply(get_pay_band)
+    # A salary range that sits inside one Agenda for Change band settles it without a request
+    def inferred_band(row):
+        posted = row['Post Date'].date() if pd.notna(row['Post Date']) else None
+        return infer_band_label(row['Min Salary'], row['Max Salary'], posted)
+
+    df['Pay Band'] = df.apply(inferred_band, axis=1)
+    missing = df['Pay Band'].isna()
+    print(f"Inferred {len(df) - missing.sum()} pay bands from salary; fetching {missing.sum()} from the advert...")
+    df.loc[missing, 'Pay Band'] = df.loc[missing, 'URL'].apply(get_pay_band)
     return df
 
 # === Filter by Pay Band 3 and Above ===
 def filter_by_band(df, min_band=3):
-    def extract_band_number(band_text):
-        match = re.search(r'(\d+)', band_text)
-        return int(match.group(1)) if match else None
-
-    df['Band Number'] = df['Pay Band'].apply(extract_band_number)
-    df = df[df['Band Number'].notnull() & (df['Band Number'] >= min_band)]
-    return df
+    # Ordered band categories: one integer comparison per row, 8a-8d kept distinct
+    df['Pay Band'] = df['Pay Band'].map(band_label).astype(BAND_DTYPE)
+    return df[band_mask(df['Pay Band'], min_band=min_band)]
 
 # === Save Final DataFrame to CSV ===
 def save_to_csv(df, filename="nhs_jobs_filtered.csv"):
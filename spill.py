@@ -0,0 +1,177 @@
+import datetime
+import heapq
+import os
+import shutil
+import tempfile
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import xlsxwriter
+
+from records import JobColumns, RECORD_FIELDS, RECORD_TYPES, NHS_COLUMNS
+from categories import categorize
+from dedupe import assign_clusters, CLUSTER_COLUMN
+
+RECORD_SCHEMA = pa.schema([(name, RECORD_TYPES[name]) for name in RECORD_FIELDS])
+
+
+def _sort_key(sort_by):
+    # Missing values sort last in a descending merge
+    return lambda row: row[sort_by] if row[sort_by] is not None else datetime.date.min
+
+def _iter_rows(parquet_path, batch_size):
+    for batch in pq.ParquetFile(parquet_path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+def _labelled(batch, columns):
+    return pa.RecordBatch.from_arrays(
+        [batch.column(name) for name in columns], names=list(columns.values())
+    )
+
+
+# --------- Bounded-Memory Results ---------
+class SpillingColumns(JobColumns):
+    """
+    JobColumns that flushes sealed chunks to Parquet files once they exceed
+    `memory_budget_mb`.
+
+    Each spilled file is sorted by `sort_by` (newest first) before it is
+    written, so the final ordering is a streaming k-way merge over the files
+    and deduplication only has to remember the keys it has already seen.
+    """
+
+    def __init__(self, memory_budget_mb=64, spill_dir=None, sort_by="date_posted", chunk_size=4096):
+        super().__init__(chunk_size=chunk_size)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.sort_by = sort_by
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="job_spill_")
+        self.spill_files = []
+
+    def memory_bytes(self):
+        return sum(chunk.nbytes for chunks in self._chunks.values() for chunk in chunks)
+
+    def _seal(self):
+        super()._seal()
+        if self.memory_bytes() > self.memory_budget:
+            self._spill()
+
+    def _sorted_table(self):
+        table = pa.table(
+            {name: pa.chunked_array(self._chunks[name], type=RECORD_TYPES[name]) for name in RECORD_FIELDS},
+            schema=RECORD_SCHEMA
+        )
+        order = pc.sort_indices(table, sort_keys=[(self.sort_by, "descending")])
+        return table.take(order)
+
+    def _spill(self):
+        if not self._chunks["title"]:
+            return
+        path = os.path.join(self.spill_dir, f"chunk_{len(self.spill_files):05d}.parquet")
+        pq.write_table(self._sorted_table(), path, compression="zstd")
+        self.spill_files.append(path)
+        self._chunks = {name: [] for name in RECORD_FIELDS}
+
+    def iter_batches(self, dedupe_on=("reference", "link"), batch_size=8192):
+        """
+        Yield record batches over every row, sorted newest first and deduplicated
+        on the first non-empty field of `dedupe_on` (the same reference-else-link
+        key nhs.finalize_results uses).
+        """
+        self._seal()
+        self._spill()  # the in-memory remainder joins the merge as one more sorted run
+
+        runs = [_iter_rows(path, batch_size) for path in self.spill_files]
+        merged = heapq.merge(*runs, key=_sort_key(self.sort_by), reverse=True)
+
+        seen = set()
+        rows = []
+        for row in merged:
+            key = next((row[name] for name in dedupe_on or () if row[name]), None)
+            if key is not None:
+                if key in seen:
+                    continue
+                seen.add(key)
+            rows.append(row)
+            if len(rows) >= batch_size:
+                yield pa.RecordBatch.from_pylist(rows, schema=RECORD_SCHEMA)
+                rows = []
+        if rows:
+            yield pa.RecordBatch.from_pylist(rows, schema=RECORD_SCHEMA)
+
+    # --------- Streaming Writers ---------
+    def write_parquet(self, path, **kwargs):
+        with pq.ParquetWriter(path, RECORD_SCHEMA, compression="zstd") as writer:
+            for batch in self.iter_batches(**kwargs):
+                writer.write_batch(batch)
+        return path
+
+    def write_csv(self, path, columns=NHS_COLUMNS, cluster_ids=None, **kwargs):
+        """`cluster_ids`, one per output row in order, adds a Cluster ID column."""
+        schema = pa.schema([(label, RECORD_TYPES[name]) for name, label in columns.items()])
+        if cluster_ids is not None:
+            schema = schema.append(pa.field(CLUSTER_COLUMN, pa.int64()))
+        with pa_csv.CSVWriter(path, schema) as writer:
+            offset = 0
+            for batch in self.iter_batches(**kwargs):
+                labelled = _labelled(batch, columns)
+                if cluster_ids is not None:
+                    ids = pa.array(cluster_ids[offset:offset + len(batch)], type=pa.int64())
+                    labelled = labelled.append_column(CLUSTER_COLUMN, ids)
+                    offset += len(batch)
+                writer.write_batch(labelled)
+        return path
+
+    def write_excel(self, path, sheet_name="Jobs", columns=NHS_COLUMNS, cluster_ids=None, **kwargs):
+        workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "default_date_format": "yyyy-mm-dd"})
+        worksheet = workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, list(columns.values()) + ([CLUSTER_COLUMN] if cluster_ids is not None else []))
+        row_index = 1
+        for batch in self.iter_batches(**kwargs):
+            for row in batch.to_pylist():
+                values = [row[name] for name in columns]
+                if cluster_ids is not None:
+                    values.append(cluster_ids[row_index - 1])
+                worksheet.write_row(row_index, 0, values)
+                row_index += 1
+        workbook.close()
+        return path
+
+    def to_frame(self, columns=NHS_COLUMNS):
+        table = pa.Table.from_batches(list(self.iter_batches()), schema=RECORD_SCHEMA)
+        table = table.select(list(columns)).rename_columns(list(columns.values()))
+        df = categorize(table.to_pandas(types_mapper=pd.ArrowDtype))
+        df.attrs.update(self.partial_attrs())
+        return df
+
+    def cleanup(self):
+        """Remove the spilled chunks; files written into `spill_dir` are left to their caller."""
+        for path in self.spill_files:
+            if os.path.exists(path):
+                os.remove(path)
+        self.spill_files = []
+
+
+# --------- Reading Results Back ---------
+def count_rows(parquet_path):
+    return pq.ParquetFile(parquet_path).metadata.num_rows
+
+def cluster_ids(parquet_path):
+    """Cluster IDs for written results in row order, read from only the columns clustering uses."""
+    text_columns = {"title": "Title", "organisation": "Organisation"}
+    return assign_clusters(read_results(parquet_path, text_columns))[CLUSTER_COLUMN].tolist()
+
+def remove_results(parquet_path):
+    """Delete written results along with the spill directory they were written into."""
+    shutil.rmtree(os.path.dirname(parquet_path), ignore_errors=True)
+
+def read_results(parquet_path, columns=NHS_COLUMNS, limit=None):
+    """Load written results as a labelled DataFrame; `limit` reads only the first rows."""
+    if limit is None:
+        table = pq.read_table(parquet_path, columns=list(columns))
+    else:
+        schema = pa.schema([(name, RECORD_TYPES[name]) for name in columns])
+        batch = next(pq.ParquetFile(parquet_path).iter_batches(batch_size=limit, columns=list(columns)), None)
+        table = pa.Table.from_batches([batch], schema=schema) if batch is not None else schema.empty_table()
+    return categorize(table.rename_columns(list(columns.values())).to_pandas(types_mapper=pd.ArrowDtype))
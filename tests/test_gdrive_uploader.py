@@ -0,0 +1,259 @@
+import re
+import threading
+import time
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import load_workbook
+
+import delta
+import gdrive_uploader
+from delta import CHANGE_COLUMN, CHANGE_LOG_SHEET
+
+
+# --------- Local Drive Stand-in ---------
+class FakeRequest:
+    def __init__(self, run):
+        self._run = run
+
+    def execute(self):
+        return self._run()
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self._requests:
+            self._callback(request_id, request.execute(), None)
+
+
+class FakeFiles:
+    def __init__(self, drive):
+        self._drive = drive
+
+    def list(self, q, fields=None):
+        name = re.search(r"name = '([^']*)'", q).group(1)
+        return FakeRequest(lambda: {"files": [
+            {"id": file_id, "name": name} for file_id, f in self._drive.workbooks.items() if f["name"] == name
+        ]})
+
+    def get(self, fileId, fields=None):
+        return FakeRequest(lambda: {"version": str(self._drive.workbooks[fileId]["version"])})
+
+    def create(self, body, media_body, fields=None):
+        return FakeRequest(lambda: {"id": self._drive.create(body["name"], _media_bytes(media_body))})
+
+    def update(self, fileId, media_body, fields=None):
+        return FakeRequest(lambda: self._drive.update(fileId, _media_bytes(media_body)))
+
+
+class FakeDrive:
+    """Workbooks held in memory, with the version counter Drive bumps on every write."""
+
+    def __init__(self):
+        self.workbooks = {}
+        self.writes = 0
+        self.on_download = None
+        self.on_update = None
+
+    def files(self):
+        return FakeFiles(self)
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+    def create(self, name, data):
+        file_id = f"file{len(self.workbooks) + 1}"
+        self.workbooks[file_id] = {"name": name, "data": data, "version": 1}
+        return file_id
+
+    def write(self, file_id, data):
+        self.workbooks[file_id]["data"] = data
+        self.workbooks[file_id]["version"] += 1
+        self.writes += 1
+        return {"id": file_id, "version": str(self.workbooks[file_id]["version"])}
+
+    def update(self, file_id, data):
+        if self.on_update is not None:
+            self.on_update(file_id)
+        return self.write(file_id, data)
+
+    def download(self, file_id):
+        data = self.workbooks[file_id]["data"]
+        if self.on_download is not None:
+            self.on_download(file_id)
+        return data
+
+    def sheets(self, file_id):
+        data = self.workbooks[file_id]["data"]
+        names = load_workbook(BytesIO(data), read_only=True).sheetnames
+        return pd.read_excel(BytesIO(data), sheet_name=names)
+
+
+def _media_bytes(media):
+    return media.getbytes(0, media.size())
+
+
+@pytest.fixture
+def drive(monkeypatch, tmp_path):
+    service = FakeDrive()
+    monkeypatch.setattr(gdrive_uploader, "get_drive_service", lambda: service)
+    monkeypatch.setattr(gdrive_uploader, "download_file", lambda svc, file_id: svc.download(file_id))
+    monkeypatch.setattr(gdrive_uploader.random, "uniform", lambda low, high: 0)
+    monkeypatch.setattr(gdrive_uploader, "_write_queue", gdrive_uploader.WorkbookWriteQueue())
+    monkeypatch.setattr(delta, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    return service
+
+
+def adverts(*rows):
+    return pd.DataFrame(
+        [{"Reference Number": ref, "Title": title, "Organisation": "Trust"} for ref, title in rows]
+    )
+
+def delta_rows(*rows, change="new"):
+    return adverts(*rows).assign(**{CHANGE_COLUMN: change})
+
+def log_lines(*rows):
+    return pd.DataFrame([{"Change": "new", "Key": ref, "Title": title} for ref, title in rows])
+
+def new_workbook(drive, df, sheet="Healthcare", name="jobs.xlsx"):
+    gdrive_uploader.upload_new_file(drive, {sheet: df}, name)
+    return next(iter(drive.workbooks))
+
+
+# --------- Delta Uploads ---------
+def test_second_upload_sends_only_changes(drive):
+    gdrive_uploader.upload_to_drive(adverts(("R1", "Staff Nurse"), ("R2", "Porter")), "Healthcare")
+    message = gdrive_uploader.upload_to_drive(
+        adverts(("R1", "Staff Nurse"), ("R2", "Senior Porter"), ("R3", "Midwife")), "Healthcare"
+    )
+
+    assert message.startswith("Sent 2 change(s) out of 3 row(s)")
+    (file_id,) = drive.workbooks
+    sheets = drive.sheets(file_id)
+    healthcare = sheets["Healthcare"].set_index("Reference Number")
+    assert list(healthcare.index) == ["R1", "R2", "R3"]
+    assert healthcare.loc["R2", "Title"] == "Senior Porter"
+    assert sorted(sheets[CHANGE_LOG_SHEET]["Key"]) == ["R1", "R2", "R2", "R3"]
+
+def test_new_daily_workbook_gets_every_row(drive, monkeypatch):
+    df = adverts(("R1", "Staff Nurse"), ("R2", "Porter"))
+    gdrive_uploader.upload_to_drive(df, "Healthcare")
+    monkeypatch.setattr(gdrive_uploader, "get_today_filename", lambda prefix=None: "tomorrow.xlsx")
+
+    message = gdrive_uploader.upload_to_drive(df, "Healthcare")
+
+    assert message.startswith("Sent 2 change(s)")
+    (file_id,) = [i for i, f in drive.workbooks.items() if f["name"] == "tomorrow.xlsx"]
+    assert sorted(drive.sheets(file_id)["Healthcare"]["Reference Number"]) == ["R1", "R2"]
+
+def test_deleted_workbook_is_recreated_in_full(drive):
+    df = adverts(("R1", "Staff Nurse"), ("R2", "Porter"))
+    gdrive_uploader.upload_to_drive(df, "Healthcare")
+    drive.workbooks.clear()
+
+    gdrive_uploader.upload_to_drive(df, "Healthcare")
+
+    (file_id,) = drive.workbooks
+    assert sorted(drive.sheets(file_id)["Healthcare"]["Reference Number"]) == ["R1", "R2"]
+
+
+# --------- Version-Checked Writes ---------
+def test_write_conflict_is_merged_on_top_of_the_other_write(drive):
+    file_id = new_workbook(drive, adverts(("R1", "Staff Nurse")))
+    other_writer = gdrive_uploader.merge_workbook(
+        drive.workbooks[file_id]["data"], {"Healthcare": delta_rows(("R2", "Porter"))}
+    ).getvalue()
+
+    def concurrent_write(file_id):
+        # Someone else saves between our download and our upload, once
+        drive.on_download = None
+        drive.write(file_id, other_writer)
+    drive.on_download = concurrent_write
+
+    attempts = gdrive_uploader.update_existing_file(drive, file_id, {"Healthcare": delta_rows(("R3", "Midwife"))})
+
+    assert attempts == 2
+    assert drive.writes == 2
+    refs = drive.sheets(file_id)["Healthcare"]["Reference Number"]
+    assert sorted(refs) == ["R1", "R2", "R3"]
+
+def test_write_between_check_and_update_is_merged_again(drive):
+    file_id = new_workbook(drive, adverts(("R1", "Staff Nurse")))
+
+    def concurrent_write(file_id):
+        # Someone else saves after our version check but before our upload lands, once
+        drive.on_update = None
+        drive.write(file_id, gdrive_uploader.merge_workbook(
+            drive.workbooks[file_id]["data"], {"Healthcare": delta_rows(("R2", "Porter"))}
+        ).getvalue())
+    drive.on_update = concurrent_write
+
+    attempts = gdrive_uploader.update_existing_file(drive, file_id, {"Healthcare": delta_rows(("R3", "Midwife"))})
+
+    assert attempts == 2
+    assert drive.writes == 3
+    assert drive.workbooks[file_id]["version"] == 4
+    assert "R3" in set(drive.sheets(file_id)["Healthcare"]["Reference Number"])
+
+def test_workbook_that_keeps_changing_raises(drive):
+    file_id = new_workbook(drive, adverts(("R1", "Staff Nurse")))
+    drive.on_download = lambda file_id: drive.write(file_id, drive.workbooks[file_id]["data"])
+
+    with pytest.raises(gdrive_uploader.WriteConflictError):
+        gdrive_uploader.update_existing_file(drive, file_id, {"Healthcare": delta_rows(("R2", "Porter"))}, attempts=3)
+
+
+# --------- Coalesced Submits ---------
+def test_concurrent_submits_are_coalesced_into_one_write(drive):
+    file_id = new_workbook(drive, adverts(("R0", "Clerk")), name="today.xlsx")
+    queue = gdrive_uploader._write_queue
+    downloading, release = threading.Event(), threading.Event()
+
+    def hold_first_write(file_id):
+        drive.on_download = None
+        downloading.set()
+        release.wait(5)
+    drive.on_download = hold_first_write
+
+    def submit(rows):
+        updates = {"Healthcare": delta_rows(*rows), CHANGE_LOG_SHEET: log_lines(*rows)}
+        return queue.submit(drive, "today.xlsx", updates)
+
+    first = threading.Thread(target=submit, args=([("R1", "Porter")],))
+    first.start()
+    assert downloading.wait(5)
+
+    # Two more uploads arrive while the first holds the workbook; both log a "Staff Nurse"
+    others = [
+        threading.Thread(target=submit, args=([("R2", "Staff Nurse")],)),
+        threading.Thread(target=submit, args=([("R3", "Staff Nurse")],)),
+    ]
+    for thread in others:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while len(queue._pending.get("today.xlsx", [])) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in [first, *others]:
+        thread.join(5)
+
+    assert drive.writes == 2
+    sheets = drive.sheets(file_id)
+    assert sorted(sheets["Healthcare"]["Reference Number"]) == ["R0", "R1", "R2", "R3"]
+    assert sorted(sheets[CHANGE_LOG_SHEET]["Key"]) == ["R1", "R2", "R3"]
+
+def test_coalesced_updates_keep_the_latest_row_per_advert():
+    updates = delta.coalesce_updates([
+        {"Healthcare": delta_rows(("R1", "Porter"))},
+        {"Healthcare": delta_rows(("R1", "Senior Porter"), change="changed")},
+    ])
+
+    assert updates["Healthcare"]["Title"].tolist() == ["Senior Porter"]
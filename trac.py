@@ -2,12 +2,24 @@ import re
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlencode
-from rapidfuzz.fuzz import partial_ratio
-import pandas as pd
 import time
 from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import gdrive_uploader
+from job_filters import FilterSpec, compile_filters
+from records import JobRecord, JobColumns, TRAC_COLUMNS
+from export import ResultExport, FORMAT_LABELS
+from jobs import get_job_manager, job_panel, deadline_after, expired, partial_notice
+from categories import band_label
+from query_planner import plan_queries, match_keywords
+from dedupe import assign_clusters
+from reference_index import get_reference_index, TRAC_REFERENCE_PATTERN
+from checkpoint import Checkpoint, run_key
+from host_control import limited_get, record_levels, tripped_hosts, MAX_CONCURRENCY
+from cost_estimate import (
+    CostEstimate, QueryEstimate, EXTRA_SAMPLE_PAGES, sample_pages, timed, rates, detail_speed, show_estimate
+)
+from dataclasses import asdict
 
 
 def generate_trac_url(keyword, page=1):
@@ -32,8 +44,7 @@ def extract_text(soup, selector):
 
 
 def normalize_band(band_str):
-    match = re.search(r'Band\s*(\d+)', band_str)
-    return f"Band {match.group(1)}" if match else ""
+    return band_label(band_str) or ""
 
 
 def extract_salary_bounds(salary_str):
@@ -46,159 +57,263 @@ def extract_salary_bounds(salary_str):
     return None, None
 
 
-def filter_by_band(band_str, min_band, max_band):
-    try:
-        band_number = int(re.search(r'\d+', band_str).group())
-        return min_band <= band_number <= max_band
-    except Exception:
-        return False
-
-
-def filter_by_salary(salary_str, min_salary):
-    digits = ''.join(filter(lambda x: x.isdigit() or x == '.', salary_str.replace(',', '')))
-    try:
-        salary = float(digits)
-        return salary >= min_salary
-    except ValueError:
-        return False
-
-
-def job_detail_passes_filters(job_url, contract_type, working_pattern, filter_sponsorship, sponsorship_preference,
-                               filter_license, license_preference):
-    try:
-        detail_response = requests.get(job_url, timeout=10)
-        detail_soup = BeautifulSoup(detail_response.text, "html.parser")
-
-        contract = extract_text(detail_soup, "#hj-job-summary > div > div > div > dl:nth-child(1) > dd:nth-child(6)")
-        pattern = extract_text(detail_soup, "#hj-job-summary > div > div > div > dl:nth-child(1) > dd:nth-child(8)")
-        description_block = detail_soup.get_text(separator=" ", strip=True)
-        requirements = analyze_job_requirements(description_block)
-        sponsorship_status = requirements["sponsorship"]
-        license_status = requirements["license"]
-
-        
+# Fields a HealthJobsUK listing row carries; everything else needs the detail page
+TRAC_LISTING_FIELDS = ("title", "band", "min_salary")
+TRAC_DETAIL_FIELDS = ("contract_type", "working_pattern", "sponsorship", "license")
 
-        info = {
-            "sponsorship": sponsorship_status,
-            "license": license_status
-        }
 
+def fetch_trac_job_detail(job_url):
+    detail_response = limited_get(requests, job_url)
+    detail_response.raise_for_status()
+    detail_soup = BeautifulSoup(detail_response.text, "html.parser")
 
-        # Filter logic
-        if contract_type and contract_type.lower() not in contract.lower():
-            return False, info
-        if working_pattern and working_pattern.lower() not in pattern.lower():
-            return False, info
-        if filter_sponsorship:
-            if sponsorship_preference == "Offered" and sponsorship_status == "Not Offered":
-                return False, info
-            if sponsorship_preference == "Not Offered" and sponsorship_status == "Offered":
-                return False, info
-        if filter_license:
-            if license_preference == "Requires License" and license_status == "Does Not Require License":
-                return False, info
-            if license_preference == "Does Not Require License" and license_status == "Requires License":
-                return False, info
-
-
-        
-
-
-        return True, info
-    except requests.RequestException:
-        return False, {"Requires Sponsorship": None, "Requires Driver's License": None}
+    contract = extract_text(detail_soup, "#hj-job-summary > div > div > div > dl:nth-child(1) > dd:nth-child(6)")
+    pattern = extract_text(detail_soup, "#hj-job-summary > div > div > div > dl:nth-child(1) > dd:nth-child(8)")
+    description_block = detail_soup.get_text(separator=" ", strip=True)
+    requirements = analyze_job_requirements(description_block)
+    reference = re.search(TRAC_REFERENCE_PATTERN, description_block)
 
+    return {
+        "reference": reference.group() if reference else None,
+        "contract_type": contract,
+        "working_pattern": pattern,
+        "sponsorship": requirements["sponsorship"],
+        "license": requirements["license"]
+    }
 
 
-def process_single_job(job, keywords, min_salary, contract_type, working_pattern, min_band, max_band,
-                       filter_sponsorship, sponsorship_preference,
-                       filter_license, license_preference):
+def parse_trac_listing(job):
+    """Extract a listing <li> into a JobRecord so the page tree can be released."""
     link_tag = job.select_one("a")
     if not link_tag:
         return None
 
-    job_url = "https://www.healthjobsuk.com" + link_tag.get("href", "")
-    title = extract_text(job, "div.hj-jobtitle.hj-job-detail")
-    band_raw = extract_text(job, "div.hj-grade.hj-job-detail")
-    band = normalize_band(band_raw)
-    employer = extract_text(job, "div.hj-employer-details")
     salary = extract_text(job, "div.hj-salary.hj-job-detail")
     min_sal, max_sal = extract_salary_bounds(salary)
+    band = normalize_band(extract_text(job, "div.hj-grade.hj-job-detail"))
+
+    return JobRecord(
+        title=extract_text(job, "div.hj-jobtitle.hj-job-detail"),
+        link="https://www.healthjobsuk.com" + link_tag.get("href", ""),
+        organisation=extract_text(job, "div.hj-employer-details"),
+        min_salary=min_sal,
+        max_salary=max_sal,
+        band=band or None,
+        source="trac",
+    )
 
-    # ✅ Updated to check against all keywords
-    if not any(partial_ratio(title.lower(), kw.lower()) >= 70 for kw in keywords):
-        return None
-    if not filter_by_band(band, min_band, max_band):
-        return None
-    if not filter_by_salary(salary, min_salary):
-        return None
 
-    passed, info = job_detail_passes_filters(
-        job_url, contract_type, working_pattern, filter_sponsorship, sponsorship_preference,
-    filter_license, license_preference
-    )
-    if not passed:
-        return None
+# process_single_job's result when the detail page couldn't be fetched, as opposed to
+# None for a job the detail checks dropped; failed jobs are left to be retried
+FETCH_FAILED = object()
 
-    return {
-        "Title": title,
-        "Employer": employer,
-        "Band": band,
-        "Min Salary": min_sal,
-        "Max Salary": max_sal,
-        "URL": job_url,
-        "Sponsorship Status": info.get("sponsorship", "Likely Offered"),
-        "License Requirement": info.get("license", "Possibly Not Required")
-    }
 
+def indexed_details(job, pipeline):
+    """
+    Detail fields either scraper already stored for `job`, if they cover every
+    field the detail checks read; the rest are left empty rather than fetched.
+    """
+    required = {check.field for check in pipeline.detail_checks}
+    return get_reference_index().details(
+        job.reference, job.link, TRAC_DETAIL_FIELDS, required=required, source="trac"
+    )
 
 
+def process_single_job(job, pipeline):
+    """
+    Fetch the detail page for a listing that already passed the cheap checks.
+    Returns the job, None when the detail checks drop it, or FETCH_FAILED.
+    """
+    index = get_reference_index()
+    detail = indexed_details(job, pipeline)
+    if detail is None:
+        try:
+            detail = fetch_trac_job_detail(job.link)
+        except requests.RequestException:
+            return FETCH_FAILED  # includes HostUnavailable from an open circuit
+        index.record(detail["reference"], "trac", job.link, band=job.band,
+                     **{field: detail[field] for field in TRAC_DETAIL_FIELDS})
+
+    job.reference = job.reference or detail["reference"]
+    job.contract_type = detail["contract_type"]
+    job.working_pattern = detail["working_pattern"]
+    job.sponsorship = detail["sponsorship"]
+    job.license = detail["license"]
+    if not pipeline.passes_detail(job):
+        return None
+    return job
 
-def scrape_trac_jobs(keywords, min_salary, contract_type, working_pattern, min_band, max_band,
-                pages_to_scrape=3):
-    all_results = []
 
-    keyword_placeholders = {kw: st.empty() for kw in keywords}
 
-    for keyword in keywords:
-        keyword_placeholder = keyword_placeholders[keyword]
-        keyword_placeholder.markdown(f"### 🔍 Searching for: `{keyword}`")
-        progress_bar = keyword_placeholder.progress(0)
 
-        total_jobs_est = pages_to_scrape * 10
-        job_counter = 0
+def scrape_trac_jobs(spec, pages_to_scrape=3, progress=None, cancel_event=None, combine=False, deadline=None):
+    """
+    Search the keywords in `spec` and return the matching jobs.
+
+    Keywords are merged into as few queries as the planner allows and each
+    result is attributed back to the keywords it matches; `pages_to_scrape`
+    is per keyword, so a combined query reads that many pages per term.
+    Without `progress` each query gets its own Streamlit progress bar;
+    background runs pass `progress(fraction, message)` instead. Setting
+    `cancel_event`, or reaching the time.monotonic() `deadline`, stops new
+    pages and detail fetches, lets running fetches finish and keeps what was
+    found; the frame's attrs then say how many pages and detail fetches were
+    skipped.
+
+    Finished pages and detail outcomes are checkpointed, so running the same
+    search again after a crash or rerun skips the work already done and
+    retries detail pages that failed to load.
+    """
+    all_results = JobColumns()
+    pipeline = compile_filters(spec, TRAC_LISTING_FIELDS)
+    plan = plan_queries(spec.keywords, "trac", combine=combine)
+    queries = plan.queries
+    run = Checkpoint(run_key("trac", asdict(spec), pages_to_scrape, [query.text for query in queries]))
+    stopped = lambda: (cancel_event is not None and cancel_event.is_set()) or expired(deadline)
+
+    query_placeholders = [st.empty() for _ in queries] if progress is None else []
+    if progress is None:
+        st.caption(f"🧭 {plan.summary(pages_to_scrape)}")
+
+    for index, query in enumerate(queries):
+        keyword = query.text
+        if stopped():
+            all_results.skipped_pages += sum(q.pages(pages_to_scrape) for q in queries[index:])
+            break
+        if progress is None:
+            keyword_placeholder = query_placeholders[index]
+            keyword_placeholder.markdown(f"### 🔍 Searching for: `{keyword}`")
+            update = keyword_placeholder.progress(0).progress
+        else:
+            update = lambda fraction, index=index, keyword=keyword: progress(
+                (index + fraction) / len(queries), f"Query {index + 1}/{len(queries)}: {keyword}"
+            )
 
-        for page in range(1, pages_to_scrape + 1):
+        job_counter = 0
+        query_pages = query.pages(pages_to_scrape)
+        total_jobs_est = query_pages * 10
+        checkpoint = run.scoped(keyword)
+        all_results.extend(checkpoint.kept())
+        done_pages, finished = checkpoint.completed_pages(), checkpoint.finished()
+
+        for page in range(1, query_pages + 1):
+            if stopped():
+                all_results.skipped_pages += len(set(range(page, query_pages + 1)) - done_pages)
+                break
+            if page in done_pages:
+                job_counter += 10
+                continue
             url = generate_trac_url(keyword, page)
             try:
-                response = requests.get(url, timeout=10)
-                soup = BeautifulSoup(response.text, "html.parser")
-                job_listings = extract_job_listings(soup)
-            except Exception:
-                continue  # skip failed requests
-
-            with ThreadPoolExecutor(max_workers=8) as executor:
+                response = limited_get(requests, url)
+                response.raise_for_status()
+            except requests.RequestException:
+                continue  # skip failed requests; an open circuit fails here without waiting
+            soup = BeautifulSoup(response.text, "html.parser")
+            listings = [parse_trac_listing(job) for job in extract_job_listings(soup)]
+            del soup
+
+            # Cheap listing checks first — no request is made for rows that fail here
+            candidates = [
+                job for job in listings if job and pipeline.passes_listing(job) and job.link not in finished
+            ]
+            job_counter += len(listings) - len(candidates)
+            for job in candidates:
+                job.matched_keywords = "; ".join(match_keywords(job.title, plan.keywords, spec.fuzzy_threshold))
+
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
                 futures = [
-                    executor.submit(
-                        process_single_job, job, keywords, min_salary, contract_type,
-                        working_pattern, min_band, max_band, filter_sponsorship, sponsorship_preference,
-                        filter_license, license_preference
-                    ) for job in job_listings
+                    executor.submit(process_single_job, job, pipeline) for job in candidates
                 ]
 
-                for future in futures:
+                draining, skipped, failed = False, 0, 0
+                for job, future in zip(candidates, futures):
+                    if stopped() and not draining:
+                        # Queued fetches are dropped; the ones already running finish and are kept
+                        skipped = sum(pending.cancel() for pending in futures)
+                        all_results.skipped_details += skipped
+                        draining = True
+                    if future.cancelled():
+                        continue
                     result = future.result()
                     job_counter += 1
-                    progress_bar.progress(min(job_counter / total_jobs_est, 1.0))
+                    update(min(job_counter / total_jobs_est, 1.0))
+                    if result is FETCH_FAILED:
+                        failed += 1  # left unfinished so a rerun fetches it again
+                        continue
                     if result:
                         all_results.append(result)
+                    checkpoint.finish_job(job, kept=bool(result))
+            all_results.failed_details += failed
+            if not (skipped or failed):
+                checkpoint.complete_page(page)
 
             time.sleep(1)
 
-        progress_bar.progress(1.0)
-        keyword_placeholder.markdown(f"✅ Done searching for: `{keyword}`")
+        update(1.0)
+        if progress is None:
+            keyword_placeholder.markdown(f"✅ Done searching for: `{keyword}`")
 
-    return pd.DataFrame(all_results)
+    record_levels()
+    if not (all_results.skipped_pages or all_results.skipped_details or all_results.failed_details):
+        run.clear()
+    return assign_clusters(all_results.to_frame(TRAC_COLUMNS))
+
+
+def estimate_trac_search(spec, pages_to_scrape=3, combine=False, extra_pages=EXTRA_SAMPLE_PAGES):
+    """
+    Dry run of scrape_trac_jobs: sample page 1 and `extra_pages` random pages
+    per query and project adverts, detail fetches, requests and duration.
+    HealthJobsUK reports no result total, so an empty sampled page is what
+    caps the page count below `pages_to_scrape`.
+    """
+    pipeline = compile_filters(spec, TRAC_LISTING_FIELDS)
+    plan = plan_queries(spec.keywords, "trac", combine=combine)
+
+    def sample(keyword, page):
+        try:
+            response, seconds = timed(limited_get, requests, generate_trac_url(keyword, page))
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        soup = BeautifulSoup(response.text, "html.parser")
+        listings = [job for job in map(parse_trac_listing, extract_job_listings(soup)) if job]
+        fetches = sum(
+            pipeline.passes_listing(job) and indexed_details(job, pipeline) is None
+            for job in listings
+        )
+        return len(listings), fetches, seconds
+
+    estimate = CostEstimate("trac", page_delay=1.0)
+    for query in plan.queries:
+        pages, samples = query.pages(pages_to_scrape), []
+        for page in sample_pages(pages, extra_pages):
+            result = sample(query.text, page)
+            if result is None:
+                continue
+            if not result[0]:
+                pages = min(pages, max(page - 1, 1))  # the results run out before this page
+                continue
+            samples.append(result)
+
+        per_page, detail_share, page_seconds = rates(samples)
+        listings = pages * per_page
+        estimate.queries.append(QueryEstimate(
+            query.text, pages, listings, listings * detail_share, page_seconds, total_reported=False
+        ))
+
+    estimate.detail_seconds, estimate.concurrency = detail_speed(
+        generate_trac_url(""), fallback=estimate.mean_page_seconds()
+    )
+    return estimate
+
+
+def run_search(params, progress, cancel_event):
+    """Background entry point for jobs.JobManager."""
+    return scrape_trac_jobs(
+        FilterSpec(**params["spec"]), params["pages_to_scrape"], progress, cancel_event,
+        combine=params.get("combine", False), deadline=deadline_after(params.get("time_budget"))
+    )
 
 
 def analyze_job_requirements(description: str) -> dict:
@@ -280,79 +395,118 @@ def job_filter_sidebar():
     pages_to_scrape = st.sidebar.number_input(
     "Pages to Scrape", min_value=1, max_value=50, value=3, step=1
 )
+    time_budget = st.sidebar.number_input(
+        "Time budget (minutes, 0 = no limit)", min_value=0, value=0,
+        help="Stop starting new pages and detail fetches after this long and show what was found."
+    )
     search = st.sidebar.button("Search Jobs 🔎")
 
-    return keywords, min_salary, contract_type, working_pattern, min_band, max_band, pages_to_scrape, search, filter_sponsorship, sponsorship_preference, filter_license, license_preference
+    return keywords, min_salary, contract_type, working_pattern, min_band, max_band, pages_to_scrape, time_budget, search, filter_sponsorship, sponsorship_preference, filter_license, license_preference
 
 
 
 # 🎯 Main UI
-st.title("🧰 Trac Job Scraper (Optimized)")
-
-(
-    keywords,  # this is now a list of keywords
-    min_salary,
-    contract_type,
-    working_pattern,
-    min_band,
-    max_band,
-    pages_to_scrape,
-    search, 
-    filter_sponsorship, sponsorship_preference,
-    filter_license, license_preference
-) = job_filter_sidebar()
-
-if search:
-    st.info("🔄 Scraping in progress... Please wait.")
-
-    df = scrape_trac_jobs(
-        keywords,  # pass the list here
+def main():
+    st.title("🧰 Trac Job Scraper (Optimized)")
+
+    (
+        keywords,  # this is now a list of keywords
         min_salary,
         contract_type,
         working_pattern,
         min_band,
         max_band,
-        pages_to_scrape
+        pages_to_scrape,
+        time_budget,
+        search, 
+        filter_sponsorship, sponsorship_preference,
+        filter_license, license_preference
+    ) = job_filter_sidebar()
+    export_format = FORMAT_LABELS[st.sidebar.selectbox("Export Format", list(FORMAT_LABELS), index=0)]
+    combine_queries = st.sidebar.checkbox("Combine keywords into fewer searches", value=False,
+                                          help="Keywords are OR-ed into shared queries and each result is "
+                                               "matched back to its keywords locally. Each keyword keeps "
+                                               "its own page budget.")
+    background = st.sidebar.checkbox("Run in background", help="Queue the search on the shared worker pool; "
+                                     "attach to it again from any session.")
+    estimate_clicked = st.sidebar.button("📏 Estimate Cost", help="Sample a few result pages per keyword and "
+                                         "project the adverts, requests and time the search would take.")
+
+    finished = job_panel("trac", "trac_job_id")
+    if finished is not None and not search:
+        st.session_state["df_trac"] = finished
+        st.success(f"✅ Background search found {len(finished)} job(s).")
+        partial_notice(finished.attrs)
+        st.dataframe(finished.head(20))
+        ResultExport(finished, "trac_jobs").download_button(export_format)
+
+    spec = FilterSpec(
+        keywords=keywords,
+        min_salary=min_salary,
+        min_band=min_band,
+        max_band=max_band,
+        contract_type=contract_type,
+        working_pattern=working_pattern,
+        sponsorship=sponsorship_preference if filter_sponsorship else None,
+        license=license_preference if filter_license else None
     )
 
-    st.session_state["df_trac"] = df
-
-    if df.empty:
-        st.warning("❌ No jobs found matching your filters.")
+    if estimate_clicked and not search:
+        with st.spinner("Sampling result pages..."):
+            estimate = estimate_trac_search(spec, int(pages_to_scrape), combine=combine_queries)
+        show_estimate(estimate, time_budget)
+
+    if search:
+        if background:
+            params = {"spec": asdict(spec), "pages_to_scrape": int(pages_to_scrape), "combine": combine_queries,
+                      "time_budget": int(time_budget) * 60}
+            st.session_state["trac_job_id"] = get_job_manager().submit("trac", params, label=", ".join(keywords))
+            st.rerun()
+
+        st.info("🔄 Scraping in progress... Please wait.")
+        df = scrape_trac_jobs(spec, pages_to_scrape, combine=combine_queries,
+                              deadline=deadline_after(time_budget * 60))
+        partial_notice(df.attrs)
+        if tripped_hosts():
+            st.warning(f"⚡ Requests to {', '.join(tripped_hosts())} were failing, so some were skipped "
+                       f"rather than waited on; results from those sites may be incomplete.")
+
+        st.session_state["df_trac"] = df
+
+        if df.empty:
+            st.warning("❌ No jobs found matching your filters.")
+        else:
+            st.success(f"✅ Found {len(df)} job(s) matching your filters.")
+            st.dataframe(df.head(20))
+
+            ResultExport(df, "trac_jobs").download_button(export_format)
+
+    # -------------------- Upload to Google Drive --------------------
+
+    if "df_trac" in st.session_state:
+        st.markdown("---")
+        st.subheader("📤 Upload to Google Drive")
+        st.markdown("#### Select Job Category for Upload")
+        category = st.selectbox("Job Category", [
+            "Admin",
+            "Healthcare",
+            "Business (PM, BA)",
+            "Finance",
+            "Tech"
+        ], index=None, placeholder="Choose a category")
+
+        if category and st.button("📤 Upload to Drive"):
+            try:
+                message = gdrive_uploader.upload_to_drive(st.session_state["df_trac"], category, prefix='trac')
+                st.success("✅ Upload completed successfully!")
+                st.caption(message)
+            except Exception as e:
+                st.error(f"❌ Upload failed: {str(e)}")
+        elif not category:
+            st.warning("⚠️ Please select a category before uploading.")
     else:
-        st.success(f"✅ Found {len(df)} job(s) matching your filters.")
-        st.dataframe(df.head(20))
-
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📥 Download results as CSV",
-            data=csv,
-            file_name="trac_jobs.csv",
-            mime="text/csv"
-        )
+        st.info("Please run a job search before uploading to Google Drive.")
 
-# -------------------- Upload to Google Drive --------------------
-
-if "df_trac" in st.session_state:
-    st.markdown("---")
-    st.subheader("📤 Upload to Google Drive")
-    st.markdown("#### Select Job Category for Upload")
-    category = st.selectbox("Job Category", [
-        "Admin",
-        "Healthcare",
-        "Business (PM, BA)",
-        "Finance",
-        "Tech"
-    ], index=None, placeholder="Choose a category")
-
-    if category and st.button("📤 Upload to Drive"):
-        try:
-            message = gdrive_uploader.upload_to_drive(st.session_state["df_trac"], category, prefix='trac')
-            st.success("✅ Upload completed successfully!")
-            st.caption(message)
-        except Exception as e:
-            st.error(f"❌ Upload failed: {str(e)}")
-    elif not category:
-        st.warning("⚠️ Please select a category before uploading.")
-else:
-    st.info("Please run a job search before uploading to Google Drive.")
+
+if __name__ == "__main__":
+    main()